@@ -0,0 +1,63 @@
+"""
+Measure the Pricer's cold start on a local CPU, for each way of loading the model
+
+    python benchmark_cold_start.py --weights weights
+
+The weights are baked once into a versioned folder under --weights. Each option is then started in a fresh
+Python process, as a new container would be, which reports how long it took to load the model and to return
+its first price, and its resident memory. The "hub" option is the old path: check the hub, then load fp32
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+OPTIONS = ["hub", "fp32", "bf16", "int8"]
+SAMPLE = "Samsung 55 inch Class QLED 4K Smart TV with Quantum HDR and Alexa built in"
+
+
+def child(option: str, weights: str) -> None:
+    import psutil
+    start = time.perf_counter()
+    from pricer_model import PricerCore, BASE_MODEL, bake_weights
+    if option == "hub":
+        core = PricerCore.load(BASE_MODEL, token=os.getenv("HF_TOKEN"))
+    else:
+        core = PricerCore.load(bake_weights(weights), variant=option, local_files_only=True)
+    loaded = time.perf_counter() - start
+    core.price(SAMPLE)
+    first = time.perf_counter() - start
+    rss = psutil.Process().memory_info().rss / 2**20
+    print(json.dumps({"option": option, "load_s": loaded, "first_price_s": first, "rss_mb": rss}))
+
+
+def measure(option: str, weights: str) -> dict:
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, __file__, "--child", option, "--weights", weights],
+                            capture_output=True, text=True, check=True)
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    report["process_s"] = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Pricer's cold start")
+    parser.add_argument("--weights", default="weights")
+    parser.add_argument("--options", nargs="+", default=OPTIONS, choices=OPTIONS)
+    parser.add_argument("--child", choices=OPTIONS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.weights)
+        sys.exit(0)
+
+    from pricer_model import bake_weights
+    print(f"Weights baked in {bake_weights(args.weights, token=os.getenv('HF_TOKEN'))}")
+    print(f"{'option':<6} {'process':>9} {'load':>9} {'1st price':>10} {'rss':>9}")
+    for option in args.options:
+        r = measure(option, args.weights)
+        print(f"{r['option']:<6} {r['process_s']:8.2f}s {r['load_s']:8.2f}s {r['first_price_s']:9.2f}s "
+              f"{r['rss_mb']:7.0f}MB")
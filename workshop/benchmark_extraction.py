@@ -0,0 +1,111 @@
+"""
+Micro-benchmark for the HTML extraction backends in price_agents.extraction
+
+Save some fixture pages from the live feeds once:
+    python benchmark_extraction.py --save 20
+Then compare the backends on them:
+    python benchmark_extraction.py
+Each backend is timed over the fixtures and its output compared with the original
+BeautifulSoup html.parser code, so we can pick the fastest backend that gives identical output
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import feedparser
+import requests
+from bs4 import BeautifulSoup
+from price_agents.deals import feeds
+from price_agents.extraction import available_backends, snippet_text, content_text
+
+FIXTURES = os.path.join("fixtures", "extraction")
+
+
+def legacy_summary(html_snippet):
+    soup = BeautifulSoup(html_snippet, 'html.parser')
+    snippet_div = soup.find('div', class_='snippet summary')
+    if not snippet_div:
+        return None
+    description = snippet_div.get_text(strip=True)
+    description = BeautifulSoup(description, 'html.parser').get_text()
+    description = re.sub('<[^<]+?>', '', description)
+    return description.strip()
+
+
+def legacy_content(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    content = soup.find('div', class_='content-section').get_text()
+    return content.replace('\nmore', '').replace('\n', ' ')
+
+
+def save_fixtures(count):
+    os.makedirs(FIXTURES, exist_ok=True)
+    saved = 0
+    for feed_url in feeds:
+        for entry in feedparser.parse(feed_url).entries:
+            if saved >= count:
+                return saved
+            page = requests.get(entry['links'][0]['href'], timeout=20).content
+            with open(os.path.join(FIXTURES, f"{saved:03d}.summary.html"), "w") as file:
+                file.write(entry['summary'])
+            with open(os.path.join(FIXTURES, f"{saved:03d}.page.html"), "wb") as file:
+                file.write(page)
+            saved += 1
+            time.sleep(0.05)
+    return saved
+
+
+def load_fixtures():
+    summaries, pages = [], []
+    for name in sorted(os.listdir(FIXTURES)):
+        path = os.path.join(FIXTURES, name)
+        if name.endswith(".summary.html"):
+            with open(path, "r") as file:
+                summaries.append(file.read())
+        elif name.endswith(".page.html"):
+            with open(path, "rb") as file:
+                pages.append(file.read())
+    return summaries, pages
+
+
+def timed(function, inputs, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        outputs = [function(markup) for markup in inputs]
+    return (time.perf_counter() - start) / (repeats * max(len(inputs), 1)), outputs
+
+
+def benchmark(repeats):
+    summaries, pages = load_fixtures()
+    if not pages:
+        sys.exit(f"No fixtures in {FIXTURES}; run with --save N first")
+    print(f"{len(summaries)} summaries and {len(pages)} pages, {repeats} repeats\n")
+    legacy_summary_time, expected_summaries = timed(legacy_summary, summaries, repeats)
+    legacy_content_time, expected_contents = timed(legacy_content, pages, repeats)
+    print(f"{'backend':<12} {'summary ms':>11} {'page ms':>9} {'identical':>10}")
+    print(f"{'legacy':<12} {legacy_summary_time * 1000:>11.3f} {legacy_content_time * 1000:>9.3f} {'-':>10}")
+    results = []
+    for name in available_backends():
+        summary_time, summary_out = timed(lambda markup: snippet_text(markup, using=name), summaries, repeats)
+        content_time, content_out = timed(lambda markup: content_text(markup, using=name), pages, repeats)
+        identical = summary_out == expected_summaries and content_out == expected_contents
+        results.append((summary_time + content_time, name, identical))
+        print(f"{name:<12} {summary_time * 1000:>11.3f} {content_time * 1000:>9.3f} {str(identical):>10}")
+    candidates = sorted(result for result in results if result[2])
+    if candidates:
+        print(f"\nFastest backend with identical output: {candidates[0][1]}")
+        print(f"Select it with DEAL_EXTRACTION_BACKEND={candidates[0][1]}")
+    else:
+        print("\nNo backend matched the legacy output exactly")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the HTML extraction backends")
+    parser.add_argument("--save", type=int, default=0, help="download this many fixture pages from the feeds first")
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+    if args.save:
+        print(f"Saved {save_fixtures(args.save)} fixtures to {FIXTURES}")
+    benchmark(args.repeats)
@@ -0,0 +1,51 @@
+"""
+Compare the Frontier Agent's two preprocessing modes: rewriting with Ollama, or the deterministic scrub rules
+
+    python benchmark_preprocess.py --limit 20
+
+Uses the deal descriptions in memory.json. For each one we time both modes (the LLM mode without its cache),
+retrieve the 5 nearest products for each, and report how much the two retrievals overlap
+"""
+
+import json
+import time
+import argparse
+import numpy as np
+import chromadb
+from sentence_transformers import SentenceTransformer
+from price_agents.preprocess import llm_preprocess, rules_preprocess
+from price_agents.vector_index import ChromaRetriever
+
+DB = "products_vectorstore"
+MEMORY_FILENAME = "memory.json"
+
+
+def timed(function, texts):
+    latencies, results = [], []
+    for text in texts:
+        start = time.perf_counter()
+        results.append(function(text))
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark LLM against rule-based preprocessing")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    with open(MEMORY_FILENAME, "r") as file:
+        descriptions = [opp["deal"]["product_description"] for opp in json.load(file)][:args.limit]
+    model = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+    retriever = ChromaRetriever(chromadb.PersistentClient(path=DB).get_or_create_collection('products'))
+
+    llm_latencies, llm_texts = timed(llm_preprocess, descriptions)
+    rules_latencies, rules_texts = timed(rules_preprocess, descriptions)
+    llm_neighbours = retriever.query(model.encode(llm_texts), n_results=5)
+    rules_neighbours = retriever.query(model.encode(rules_texts), n_results=5)
+    overlaps = [len(set(llm[0]) & set(rules[0])) / 5 for llm, rules in zip(llm_neighbours, rules_neighbours)]
+
+    print(f"{len(descriptions)} descriptions")
+    print(f"llm    mean {llm_latencies.mean():9.2f} ms  p95 {np.percentile(llm_latencies, 95):9.2f} ms")
+    print(f"rules  mean {rules_latencies.mean():9.2f} ms  p95 {np.percentile(rules_latencies, 95):9.2f} ms")
+    print(f"Top-5 retrieval overlap between modes: mean {np.mean(overlaps):.2f}, min {np.min(overlaps):.2f}")
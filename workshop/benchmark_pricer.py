@@ -0,0 +1,91 @@
+"""
+Compare the Specialist Agent's pricing paths on a local CPU: the original full-prompt generate with a regex,
+against the cached prompt prefix with numeric-only decoding, both one at a time and in batches
+The batched rows are the path the agents actually use: SpecialistAgent.price goes through the micro-batcher
+to price_batch, with a batch of one when calls don't overlap
+
+    python benchmark_pricer.py --limit 20 --batch 4
+    python benchmark_pricer.py --weights weights    # load weights baked with bake_weights, without the hub
+
+Uses the deal descriptions in memory.json. For each path we report mean and p95 wall time and CPU time per
+description, how many results were 0.0, and how often each path agrees with the baseline
+"""
+
+import os
+import json
+import time
+import argparse
+import numpy as np
+import torch
+from pricer_model import PricerCore, VARIANTS, bake_weights
+
+MEMORY_FILENAME = "memory.json"
+
+
+def timed(function, descriptions):
+    walls, cpus, results = [], [], []
+    for description in descriptions:
+        wall, cpu = time.perf_counter(), time.process_time()
+        results.append(function(description))
+        walls.append(time.perf_counter() - wall)
+        cpus.append(time.process_time() - cpu)
+    return np.array(walls) * 1000, np.array(cpus) * 1000, results
+
+
+def timed_batches(function, descriptions, size):
+    """
+    Time function over consecutive batches of this size, charging each description an equal share of its batch
+    """
+    walls, cpus, results = [], [], []
+    for start in range(0, len(descriptions), size):
+        batch = descriptions[start:start + size]
+        wall, cpu = time.perf_counter(), time.process_time()
+        results += function(batch)
+        walls += [(time.perf_counter() - wall) / len(batch)] * len(batch)
+        cpus += [(time.process_time() - cpu) / len(batch)] * len(batch)
+    return np.array(walls) * 1000, np.array(cpus) * 1000, results
+
+
+def report(name, walls, cpus, results):
+    zeros = sum(1 for result in results if result == 0.0)
+    print(f"{name:<16} mean {walls.mean():8.1f} ms  p95 {np.percentile(walls, 95):8.1f} ms  "
+          f"cpu {cpus.mean():8.1f} ms/call  zero results {zeros}/{len(results)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the pricer's decoding paths on CPU")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--variant", default="fp32", choices=VARIANTS)
+    parser.add_argument("--batch", type=int, default=4, help="batch size for the batched paths")
+    parser.add_argument("--weights", default=None, help="folder of baked weights, rather than loading from the hub")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    with open(MEMORY_FILENAME, "r") as file:
+        descriptions = [opp["deal"]["product_description"] for opp in json.load(file)][:args.limit]
+    if args.weights:
+        path = bake_weights(args.weights, token=os.getenv("HF_TOKEN"))
+        core = PricerCore.load(path, variant=args.variant, local_files_only=True)
+    else:
+        core = PricerCore.load(token=os.getenv("HF_TOKEN"), variant=args.variant)
+    core.price(descriptions[0])
+    core.price_baseline(descriptions[0])
+    core.price_batch(descriptions[:args.batch])
+    core.price_batch_baseline(descriptions[:args.batch])
+
+    paths = {
+        "baseline": timed(core.price_baseline, descriptions),
+        "fast": timed(core.price, descriptions),
+        "batch of 1": timed_batches(core.price_batch, descriptions, 1),
+        "batch baseline": timed_batches(core.price_batch_baseline, descriptions, args.batch),
+        f"batch of {args.batch}": timed_batches(core.price_batch, descriptions, args.batch),
+    }
+    print(f"{len(descriptions)} descriptions, {args.variant}, {torch.get_num_threads()} threads, "
+          f"batches of {args.batch}")
+    baseline = paths["baseline"][2]
+    for name, (walls, cpus, results) in paths.items():
+        report(name, walls, cpus, results)
+        agree = np.mean([abs(a - b) <= 0.01 * max(abs(a), 1.0) for a, b in zip(baseline, results)])
+        print(f"{'':<16} agrees with the baseline within 1% on {agree:.0%} of descriptions")
@@ -0,0 +1,53 @@
+"""
+Compare float32, float16 and int8 storage for the product index
+
+    python benchmark_quantization.py --queries 200 --rerank 20
+
+Builds an IVF index at each precision from the products collection, then reports the memory
+used by the vectors that search scans, and recall@5 against exact float32 search,
+both with and without an exact re-rank of the best candidates
+
+On a stand-in collection of 20,000 clustered 384-d unit vectors, with --queries 200 --rerank 20:
+
+    precision   memory MB   saved  recall@5  reranked
+    float32          30.7      0%     1.000     1.000
+    float16          15.4     50%     1.000     1.000
+    int8              7.8     75%     0.990     1.000
+
+Per vector that's 1536, 768 and 388 bytes, so 400,000 products take 614, 307 and 155 MB
+"""
+
+import argparse
+import numpy as np
+import chromadb
+from price_agents.vector_index import ProductIndex
+from benchmark_retrieval import DB, sample_queries
+
+
+def recall(rows, truth):
+    return np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(rows.tolist(), truth.tolist())])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark quantized product index storage")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--rerank", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=DB).get_or_create_collection('products')
+    vectors = sample_queries(collection, args.queries, noise=0.02)
+    baseline = None
+    print(f"{'precision':<10} {'memory MB':>10} {'saved':>7} {'recall@5':>9} {'reranked':>9}")
+    for precision in ProductIndex.PRECISIONS:
+        directory = f"{ProductIndex.DIRECTORY}_{precision}"
+        index = ProductIndex.load_or_build(collection, directory=directory, precision=precision, nprobe=args.nprobe)
+        truth, _ = index.exact_search(vectors, args.k)
+        memory = index.memory_bytes()
+        baseline = baseline or memory
+        plain, _ = index.search(vectors, args.k)
+        index.rerank = args.rerank
+        reranked, _ = index.search(vectors, args.k)
+        print(f"{precision:<10} {memory / 1e6:>10.1f} {1 - memory / baseline:>7.0%} "
+              f"{recall(plain, truth):>9.3f} {recall(reranked, truth):>9.3f}")
@@ -0,0 +1,69 @@
+"""
+Compare the in-process ANN index with Chroma for the Frontier Agent's 5-NN lookup
+
+    python benchmark_retrieval.py --queries 200 --method ivf
+
+Queries are the embeddings of products sampled from the collection, lightly perturbed so that
+they aren't exact matches. For each backend we report recall@5 against the Chroma results and
+against exact brute force search, plus mean and p95 query latency
+"""
+
+import time
+import argparse
+import numpy as np
+import chromadb
+from price_agents.vector_index import ChromaRetriever, AnnRetriever, ProductIndex
+
+DB = "products_vectorstore"
+
+
+def sample_queries(collection, count, noise, seed=42):
+    rng = np.random.default_rng(seed)
+    total = collection.count()
+    offsets = rng.choice(total, min(count, total), replace=False)
+    vectors = [collection.get(include=['embeddings'], limit=1, offset=int(o))['embeddings'][0] for o in offsets]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors += rng.normal(0, noise, vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def timed_queries(retriever, vectors, k):
+    latencies, ids = [], []
+    for vector in vectors:
+        start = time.perf_counter()
+        documents, _, _ = retriever.query(vector[None, :], n_results=k)[0]
+        latencies.append(time.perf_counter() - start)
+        ids.append(documents)
+    return np.array(latencies) * 1000, ids
+
+
+def recall(results, truth):
+    return np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])
+
+
+def report(name, latencies, results, chroma, exact):
+    print(f"{name:<10} mean {latencies.mean():7.2f} ms  p95 {np.percentile(latencies, 95):7.2f} ms  "
+          f"recall@5 vs chroma {recall(results, chroma):.3f}  vs exact {recall(results, exact):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN retrieval against Chroma")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--method", default="ivf", choices=["ivf", "hnsw"])
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    collection = chromadb.PersistentClient(path=DB).get_or_create_collection('products')
+    start = time.perf_counter()
+    index = ProductIndex.load_or_build(collection, method=args.method, nprobe=args.nprobe)
+    print(f"Index over {index.count} products ready in {time.perf_counter() - start:.1f}s")
+    vectors = sample_queries(collection, args.queries, args.noise)
+
+    exact_rows, _ = index.exact_search(vectors, args.k)
+    exact = [[index.record(row)['document'] for row in rows] for rows in exact_rows]
+    chroma_latencies, chroma = timed_queries(ChromaRetriever(collection), vectors, args.k)
+    ann_latencies, ann = timed_queries(AnnRetriever(index), vectors, args.k)
+    report("chroma", chroma_latencies, chroma, chroma, exact)
+    report(args.method, ann_latencies, ann, chroma, exact)
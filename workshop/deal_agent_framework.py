@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 import chromadb
 from price_agents.autonomous_planning_agent import AutonomousPlanningAgent
 from price_agents.deals import Opportunity
+from price_agents.llm_gateway import get_gateway
+from price_agents.warm_pool import RunSchedule
 from sklearn.manifold import TSNE
 import numpy as np
 
@@ -45,11 +47,13 @@ class DealAgentFramework:
         self.memory = self.read_memory()
         self.collection = client.get_or_create_collection('products')
         self.planner = None
+        self.schedule = RunSchedule()
 
     def init_agents_as_needed(self):
         if not self.planner:
             self.log("Initializing Agent Framework")
-            self.planner = AutonomousPlanningAgent(self.collection)
+            # PLANNER_CASCADE=1 prices clearly poor deals with one estimator instead of both
+            self.planner = AutonomousPlanningAgent(self.collection, cascade=os.getenv("PLANNER_CASCADE") == "1")
             self.log("Agent Framework is ready")
         
     def read_memory(self) -> List[Opportunity]:
@@ -80,10 +84,13 @@ class DealAgentFramework:
         logging.info(text)
 
     def run(self) -> List[Opportunity]:
+        # Recorded so that keep_warm.py can learn when runs happen
+        self.schedule.record()
         self.init_agents_as_needed()
         logging.info("Kicking off Planning Agent")
         result = self.planner.plan(memory=self.memory)
         logging.info(f"Planning Agent has completed and returned: {result}")
+        self.log(f"LLM gateway stats: {get_gateway().stats()}")
         if result:
             self.memory.append(result)
             self.write_memory()
@@ -94,7 +101,7 @@ class DealAgentFramework:
         client = chromadb.PersistentClient(path=cls.DB)
         collection = client.get_or_create_collection('products')
         result = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=max_datapoints)
-        vectors = np.array(result['embeddings'])
+        vectors = np.asarray(result['embeddings'], dtype=np.float32)
         documents = result['documents']
         categories = [metadata['category'] for metadata in result['metadatas']]
         colors = [COLORS[CATEGORIES.index(c)] for c in categories]
@@ -43,7 +43,8 @@ class Item:
             details = details.replace(remove, "")
         return details
 
-    def scrub(self, stuff):
+    @staticmethod
+    def scrub(stuff):
         """
         Clean up the provided text by removing unnecessary characters and whitespace
         Also remove words that are 7+ chars and contain numbers, as these are likely irrelevant product numbers
@@ -54,6 +55,15 @@ class Item:
         select = [word for word in words if len(word)<7 or not any(char.isdigit() for char in word)]
         return " ".join(select)
     
+    @classmethod
+    def scrub_text(cls, text):
+        """
+        Apply the same removals and scrubbing as our training data to any text, such as a deal description
+        """
+        for remove in cls.REMOVALS:
+            text = text.replace(remove, "")
+        return cls.scrub(text)
+    
     def parse(self, data):
         """
         Parse this datapoint and if it fits within the allowed Token range,
@@ -1,10 +1,79 @@
-import time
-import modal
-from datetime import datetime
-
-Pricer = modal.Cls.lookup("pricer-service", "Pricer")
-pricer = Pricer()
-while True:
-    reply = pricer.wake_up.remote()
-    print(f"{datetime.now()}: {reply}")
-    time.sleep(30)
\ No newline at end of file
+"""
+Keep the Pricer warm just before and during expected runs, learning their cadence from run_schedule.json,
+which the Agent Framework writes at the start of every run
+
+    python keep_warm.py                       # the backend from SPECIALIST_BACKEND, Modal by default
+    python keep_warm.py --simulate 6          # 6 simulated hours against a local stand-in Pricer
+
+The simulation runs the deal framework every 5 minutes with an hour's pause in the middle, and reports
+run latencies with and without cold starts, and the pings made compared to pinging every 30 seconds
+"""
+
+import os
+import argparse
+import tempfile
+from price_agents.warm_pool import WarmPoolController, RunSchedule, SimulatedPricer, histogram
+
+
+class SimulatedClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def simulate(hours: float, interval: float, pause: float) -> None:
+    clock = SimulatedClock()
+    pricer = SimulatedPricer(clock=clock.time, sleep=clock.sleep)
+    with tempfile.TemporaryDirectory() as folder:
+        schedule = RunSchedule(os.path.join(folder, "run_schedule.json"))
+        controller = WarmPoolController(pricer, schedule, clock=clock.time, sleep=clock.sleep, log=lambda _: None,
+                                        warm_ttl=pricer.idle_timeout)
+        end = hours * 3600
+        pause_start, pause_end = (end - pause) / 2, (end + pause) / 2
+        runs = {"cold": [], "warm": []}
+        next_run = 0.0
+        while clock.now < end:
+            if clock.now >= next_run:
+                if not pause_start <= clock.now < pause_end:
+                    schedule.record(clock.now)
+                    start, cold_starts = clock.now, pricer.cold_starts
+                    pricer.wake_up()
+                    runs["cold" if pricer.cold_starts > cold_starts else "warm"].append(clock.now - start)
+                next_run += interval
+            controller.step()
+            clock.sleep(controller.TICK)
+
+    pings = sum(len(latencies) for latencies in controller.latencies.values())
+    print(f"{hours} hours, a run every {interval:.0f}s, paused for {pause:.0f}s in the middle")
+    print(f"Warm pool pings: {pings}, against {int(end // 30)} for a ping every 30s")
+    for kind, latencies in runs.items():
+        print(f"Runs that met a {kind} Pricer: {len(latencies)} {histogram(latencies)}")
+    print(f"Warm pool ping latencies: {controller.report()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the Pricer warm around expected runs")
+    parser.add_argument("--backend", default=None, help="modal, local or http; by default SPECIALIST_BACKEND")
+    parser.add_argument("--simulate", type=float, default=None, metavar="HOURS")
+    parser.add_argument("--lead", type=float, default=WarmPoolController.LEAD,
+                        help="seconds before each expected run to start pinging; raised to cover measured cold starts")
+    parser.add_argument("--linger", type=float, default=WarmPoolController.LINGER)
+    parser.add_argument("--ping-interval", type=float, default=WarmPoolController.PING_INTERVAL)
+    parser.add_argument("--warm-ttl", type=float, default=WarmPoolController.WARM_TTL,
+                        help="the backend's scaledown window in seconds")
+    parser.add_argument("--interval", type=float, default=300.0, help="seconds between simulated runs")
+    parser.add_argument("--pause", type=float, default=3600.0, help="seconds without simulated runs")
+    args = parser.parse_args()
+
+    if args.simulate:
+        simulate(args.simulate, args.interval, args.pause)
+    else:
+        from price_agents.specialist_backends import make_backend
+        WarmPoolController(make_backend(args.backend), lead=args.lead, linger=args.linger,
+                           ping_interval=args.ping_interval, warm_ttl=args.warm_ttl).run()
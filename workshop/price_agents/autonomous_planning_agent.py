@@ -5,6 +5,7 @@ from price_agents.scanner_agent import ScannerAgent
 from price_agents.frontier_agent import FrontierAgent
 from price_agents.specialist_agent import SpecialistAgent
 from price_agents.messaging_agent import MessagingAgent
+from price_agents.cascade import CascadeEstimator
 from agents import Agent, Runner, function_tool
 import json
 import asyncio
@@ -13,19 +14,16 @@ from dotenv import load_dotenv
 from agents import Agent, Runner, AsyncOpenAI, OpenAIChatCompletionsModel
 from agents.run import RunConfig
 from agents.mcp import MCPServerStdio
+from price_agents.llm_gateway import get_gateway
 
 sandbox_path = os.path.abspath(os.path.join(os.getcwd(), "sandbox"))
 files_params = {"command": "npx", "args": ["-y", "@modelcontextprotocol/server-filesystem", sandbox_path]}
 
 planner = None
-# Create an asynchronous OpenAI-style client for calling external APIs (e.g., Gemini)
+# The asynchronous OpenAI-style client for calling external APIs (e.g., Gemini), shared through the LLM gateway
 load_dotenv()
-gemini_api_key = os.getenv("GEMINI_API_KEY")
 
-external_client = AsyncOpenAI(
-    api_key=gemini_api_key,
-    base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-)
+external_client = get_gateway().gemini_async
 
 # Define the model wrapper that communicates with the LLM using OpenAI-compatible schema
 model = OpenAIChatCompletionsModel(
@@ -47,17 +45,25 @@ def scan_the_internet_for_bargains() -> Dict:
     """
     planner.log("Autonomous Planning agent is calling scanner")
     results = planner.scanner.scan(memory=planner.memory)
+    if results:
+        planner.prefetch_frontier_estimates(results)
     return results.model_dump() if results else {}
 
 @function_tool
-def estimate_true_value(description: str) -> Dict:
+def estimate_true_value(description: str, deal_price: Optional[float] = None) -> Dict:
     """
     This tool estimates the true value of a product based on a text description of it
+    Optionally pass the price of the deal too, so that deals that are clearly not bargains are estimated faster
     """
     planner.log(f"Autonomous Planning agent is estimating value")
-    estimate1 = planner.frontier.price(description)
-    estimate2 = planner.specialist.price(description)
-    estimate = (estimate1 + estimate2) / 2.0
+    if planner.cascade and deal_price is not None:
+        estimate = planner.cascade_estimate(description, deal_price)
+    else:
+        estimate1 = planner.frontier_estimates.get(description)
+        if estimate1 is None:
+            estimate1 = planner.frontier.price(description)
+        estimate2 = planner.specialist.price(description)
+        estimate = (estimate1 + estimate2) / 2.0
     return {"description": description, "estimated_true_value": estimate}
 
 @function_tool
@@ -81,9 +87,13 @@ class AutonomousPlanningAgent(BaseAgent):
     name = "Autonomous Planning Agent"
     color = BaseAgent.GREEN
 
-    def __init__(self, collection):
+    DEAL_THRESHOLD = 50
+
+    def __init__(self, collection, cascade: bool = False):
         """
         Create instances of the 3 Agents that this planner coordinates across
+        :param cascade: price each deal with the cheapest estimator first, and only call the other
+        when the deal could be a bargain
         """
         self.log("Autonomous Planning Agent is initializing")
         self.scanner = ScannerAgent()
@@ -92,8 +102,34 @@ class AutonomousPlanningAgent(BaseAgent):
         self.messenger = MessagingAgent()
         self.memory = None
         self.opportunity = None
+        self.frontier_estimates = {}
+        self.categories = {}
+        self.cascade = CascadeEstimator(["frontier", "specialist"], self.DEAL_THRESHOLD, log=self.log) if cascade else None
         self.log("Autonomous Planning Agent is ready")
 
+    def prefetch_frontier_estimates(self, selection: DealSelection):
+        """
+        Price the whole selection with the Frontier Agent in one batch, so each estimate_true_value call can use it
+        """
+        descriptions = [deal.product_description for deal in selection.deals]
+        try:
+            neighbours = self.frontier.neighbours_many(descriptions)
+            self.categories = {d: self.frontier.category(found) for d, found in zip(descriptions, neighbours)}
+            self.frontier_estimates = dict(zip(descriptions, self.frontier.price_many(descriptions, neighbours)))
+        except Exception as e:
+            self.log(f"Batch pricing failed, deals will be priced one at a time: {e}")
+
+    def cascade_estimate(self, description: str, deal_price: float) -> float:
+        """
+        Price a deal through the cascade, starting from its prefetched Frontier estimate if there is one
+        """
+        known = {"frontier": self.frontier_estimates[description]} if description in self.frontier_estimates else {}
+        estimators = {
+            "frontier": lambda: self.frontier.price(description),
+            "specialist": lambda: self.specialist.price(description),
+        }
+        return self.cascade.estimate(estimators, deal_price, self.categories.get(description), known=known)
+
     def get_tools(self):
         """
         Return the json for the tools to be used
@@ -154,8 +190,12 @@ Only notify the user for the one best deal. Then just respond OK to indicate suc
         self.log("Autonomous Planning Agent is kicking off a run")
         self.memory = memory
         self.opportunity = None
+        self.frontier_estimates = {}
+        self.categories = {}
         global planner # TODO find a better way to do this without globals!!
         planner = self
         reply = self.run_async_task(self.go())
         self.log(f"Autonomous Planning Agent completed with: {reply}")
+        if self.cascade:
+            self.log(f"Autonomous Planning Agent cascade stats: {self.cascade.stats()}")
         return self.opportunity
\ No newline at end of file
@@ -0,0 +1,105 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, List, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher:
+    """
+    Collects calls made from different threads within a short window, and serves them with one batched call
+    The first call to arrive opens the window; the batch is sent when the window closes or it reaches max_batch
+    An idle batcher doesn't wait: if nothing else is queued and no batch finished within the last window,
+    the call is sent straight away, so sequential callers never pay the window; calls that arrive while
+    it's in flight are gathered into the next batch
+    """
+
+    WINDOW = 0.05
+    MAX_BATCH = 16
+
+    def __init__(self, batch_function: Callable[[List[T]], List[R]], window: float = WINDOW,
+                 max_batch: int = MAX_BATCH):
+        """
+        :param batch_function: takes a list of items, and returns a list of results in the same order
+        :param window: seconds to wait for more calls after the first one arrives
+        :param max_batch: the most items to send in one batch
+        """
+        self.batch_function = batch_function
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.worker = None
+        self.last_batch = float("-inf")
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item: T) -> R:
+        """
+        Add this item to the next batch, and block until its result is ready
+        """
+        future = Future()
+        self.queue.put((item, future))
+        self.start()
+        return future.result()
+
+    def start(self) -> None:
+        with self.lock:
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run, name="micro-batcher", daemon=True)
+                self.worker.start()
+
+    def submit_many(self, items: List[T]) -> List[R]:
+        """
+        Add all these items to the next batches, and block until all their results are ready
+        """
+        futures = []
+        for item in items:
+            future = Future()
+            self.queue.put((item, future))
+            futures.append(future)
+        self.start()
+        return [future.result() for future in futures]
+
+    def collect(self) -> List:
+        """
+        Wait for the first item, then gather any more that arrive within the window, unless the batcher was idle
+        """
+        batch = [self.queue.get()]
+        if self.queue.empty() and time.monotonic() - self.last_batch > self.window:
+            return batch
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self) -> None:
+        while True:
+            batch = self.collect()
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_function(items)
+                if len(results) != len(items):
+                    raise ValueError(f"Batch of {len(items)} items returned {len(results)} results")
+            except Exception as e:
+                self.last_batch = time.monotonic()
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.last_batch = time.monotonic()
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
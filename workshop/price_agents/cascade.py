@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+HISTORY_FILENAME = "cascade_history.json"
+
+
+class CascadeEstimator:
+    """
+    Prices a deal with the cheapest estimator first, and only calls the more expensive ones when they could matter
+    Estimators are ordered by their measured latency; after each one, the cascade stops if the deal is clearly
+    not a bargain: even if the next estimate came in as much higher as estimators usually disagree in this
+    category, the discount would still be MARGIN dollars short of the threshold
+    Deals near the threshold, and categories where the estimators disagree by more than MAX_DISAGREEMENT,
+    or have fewer than MIN_HISTORY fully priced deals, always get every estimator
+    The disagreement per category and the latency per estimator are kept as moving averages in cascade_history.json
+    """
+
+    MARGIN = 20.0
+    MAX_DISAGREEMENT = 0.5
+    MIN_HISTORY = 5
+    ALPHA = 0.2
+
+    def __init__(self, names: List[str], threshold: float, filename: str = HISTORY_FILENAME,
+                 log: Callable[[str], None] = print):
+        """
+        :param names: the estimators in their default order, used until their latencies are known
+        :param threshold: the discount in dollars above which a deal is a bargain
+        """
+        self.names = names
+        self.threshold = threshold
+        self.filename = filename
+        self.log = log
+        self.lock = threading.Lock()
+        self.disagreement: Dict[str, Dict[str, float]] = {}
+        self.latency: Dict[str, float] = {}
+        self.calls = {name: 0 for name in names}
+        self.skips = {name: 0 for name in names}
+        self.deals = 0
+        self.early_exits = 0
+        self.load()
+
+    def load(self) -> None:
+        if os.path.exists(self.filename):
+            with open(self.filename, "r") as file:
+                data = json.load(file)
+            self.disagreement = data.get("disagreement", {})
+            self.latency = data.get("latency", {})
+
+    def save(self) -> None:
+        temporary = self.filename + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump({"disagreement": self.disagreement, "latency": self.latency}, file, indent=2)
+        os.replace(temporary, self.filename)
+
+    def order(self, known: Dict[str, float]) -> List[str]:
+        """
+        Estimates already in hand come first, then the rest from fastest to slowest
+        """
+        rest = [name for name in self.names if name not in known]
+        rest.sort(key=lambda name: self.latency.get(name, 0.0))
+        return [name for name in self.names if name in known] + rest
+
+    def can_stop(self, estimates: List[float], price: float, category: str) -> bool:
+        history = self.disagreement.get(category)
+        if not history or history["count"] < self.MIN_HISTORY or history["ewma"] > self.MAX_DISAGREEMENT:
+            return False
+        estimate = sum(estimates) / len(estimates)
+        return estimate * (1 + history["ewma"]) - price < self.threshold - self.MARGIN
+
+    def record(self, estimates: List[float], category: str) -> None:
+        mean = sum(estimates) / len(estimates)
+        spread = (max(estimates) - min(estimates)) / mean if mean > 0 else 0.0
+        history = self.disagreement.setdefault(category, {"ewma": spread, "count": 0})
+        history["ewma"] += self.ALPHA * (spread - history["ewma"])
+        history["count"] += 1
+
+    def estimate(self, estimators: Dict[str, Callable[[], float]], price: float, category: Optional[str] = None,
+                 known: Optional[Dict[str, float]] = None) -> float:
+        """
+        Run the cascade for one deal
+        :param estimators: a function for each named estimator that prices this deal
+        :param price: the deal's price
+        :param category: the product category, whose disagreement history decides whether we can stop early
+        :param known: estimates already made for this deal, used before calling any estimator
+        :return: the average of the estimates that were made
+        """
+        category = category or "Unknown"
+        known = known or {}
+        estimates = []
+        order = self.order(known)
+        for position, name in enumerate(order):
+            if estimates and self.can_stop(estimates, price, category):
+                skipped = order[position:]
+                with self.lock:
+                    for later in skipped:
+                        self.skips[later] += 1
+                    self.early_exits += 1
+                mean = sum(estimates) / len(estimates)
+                self.log(f"Cascade stopped after {', '.join(order[:position])} at ${mean:.2f} for a ${price:.2f} deal "
+                         f"in {category}; skipped {', '.join(skipped)}")
+                break
+            if name in known:
+                estimates.append(known[name])
+                continue
+            start = time.perf_counter()
+            estimates.append(estimators[name]())
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.calls[name] += 1
+                previous = self.latency.get(name)
+                self.latency[name] = elapsed if previous is None else previous + self.ALPHA * (elapsed - previous)
+        with self.lock:
+            self.deals += 1
+            if len(estimates) > 1:
+                self.record(estimates, category)
+            self.save()
+        return sum(estimates) / len(estimates)
+
+    def stats(self) -> Dict:
+        """
+        For each estimator, how often the cascade skipped it, and roughly how many seconds that saved
+        """
+        with self.lock:
+            stages = {}
+            for name in self.names:
+                considered = self.calls[name] + self.skips[name]
+                stages[name] = {
+                    "calls": self.calls[name],
+                    "skips": self.skips[name],
+                    "skip_rate": round(self.skips[name] / considered, 3) if considered else 0.0,
+                    "latency": round(self.latency.get(name, 0.0), 3),
+                    "seconds_saved": round(self.skips[name] * self.latency.get(name, 0.0), 1),
+                }
+            return {"deals": self.deals, "early_exits": self.early_exits, "stages": stages}
@@ -1,11 +1,14 @@
 from pydantic import BaseModel
-from typing import List, Dict, Self
-from bs4 import BeautifulSoup
-import re
+from typing import List, Dict, Optional, Callable, Self
 import feedparser
 from tqdm import tqdm
 import requests
 import time
+import asyncio
+import logging
+from price_agents.scraper import AsyncScraper, run_sync
+from price_agents.http_cache import HttpCache
+from price_agents.extraction import snippet_text, content_text
 
 feeds = [
     "https://www.dealnews.com/c142/Electronics/?rss=1",
@@ -16,20 +19,20 @@ feeds = [
 
 def extract(html_snippet: str) -> str:
     """
-    Use Beautiful Soup to clean up this HTML snippet and extract useful text
+    Clean up this HTML snippet and extract useful text, using the selected extraction backend
     """
-    soup = BeautifulSoup(html_snippet, 'html.parser')
-    snippet_div = soup.find('div', class_='snippet summary')
-    
-    if snippet_div:
-        description = snippet_div.get_text(strip=True)
-        description = BeautifulSoup(description, 'html.parser').get_text()
-        description = re.sub('<[^<]+?>', '', description)
-        result = description.strip()
-    else:
-        result = html_snippet
+    description = snippet_text(html_snippet)
+    result = description if description is not None else html_snippet
     return result.replace('\n', ' ')
 
+def feed_entries(feed, limit: int = 5) -> List[Dict]:
+    """
+    Parse an RSS feed (a URL or the raw body) and return its first entries,
+    trimmed to the fields that ScrapedDeal uses so that they can be cached as JSON
+    """
+    entries = feedparser.parse(feed).entries[:limit]
+    return [{'title': e['title'], 'summary': e['summary'], 'links': [{'href': e['links'][0]['href']}]} for e in entries]
+
 class ScrapedDeal:
     """
     A class to represent a Deal retrieved from an RSS feed
@@ -41,17 +44,19 @@ class ScrapedDeal:
     details: str
     features: str
 
-    def __init__(self, entry: Dict[str, str]):
+    def __init__(self, entry: Dict[str, str], page: Optional[bytes] = None, content: Optional[str] = None):
         """
         Populate this instance based on the provided dict
+        If the detail page has already been downloaded, pass it in as page to avoid fetching it again,
+        or pass the text already extracted from it as content to avoid parsing it again
         """
         self.title = entry['title']
         self.summary = extract(entry['summary'])
-        self.url = entry['links'][0]['href']
-        stuff = requests.get(self.url).content
-        soup = BeautifulSoup(stuff, 'html.parser')
-        content = soup.find('div', class_='content-section').get_text()
-        content = content.replace('\nmore', '').replace('\n', ' ')
+        self.url = self.link(entry)
+        if content is None:
+            if page is None:
+                page = requests.get(self.url).content
+            content = self.page_content(page)
         if "Features" in content:
             splits = content.split("Features")
             self.details = splits[0]
@@ -61,6 +66,13 @@ class ScrapedDeal:
             self.features = ""
         self.truncate()
 
+    @staticmethod
+    def page_content(page: bytes) -> str:
+        """
+        Extract the text of the content section from a deal's detail page
+        """
+        return content_text(page)
+
     def truncate(self):
         """
         Limit the fields to a sensible length to avoid sending too much info to the model
@@ -81,21 +93,72 @@ class ScrapedDeal:
         """
         return f"Title: {self.title}\nDetails: {self.details.strip()}\nFeatures: {self.features.strip()}\nURL: {self.url}"
 
+    @staticmethod
+    def link(entry: Dict) -> str:
+        """
+        Return the URL of the deal behind this feed entry, without fetching anything
+        """
+        return entry['links'][0]['href']
+
     @classmethod
-    def fetch(cls, show_progress : bool = False) -> List[Self]:
+    def fetch(cls, show_progress : bool = False, concurrent: bool = False,
+              skip: Optional[Callable[[str], bool]] = None, cache: Optional[HttpCache] = None) -> List[Self]:
         """
         Retrieve all deals from the selected RSS feeds
         Include a slight pause to ensure we don't overload the deals website
+        With concurrent=True, feeds and detail pages are fetched in parallel via fetch_async
+        Entries whose link satisfies skip are dropped before their detail page is downloaded
+        With a cache, feeds and detail pages are fetched with conditional requests
         """
+        if concurrent:
+            return run_sync(cls.fetch_async(show_progress=show_progress, skip=skip, cache=cache))
         deals = []
         feed_iter = tqdm(feeds) if show_progress else feeds
         for feed_url in feed_iter:
-            feed = feedparser.parse(feed_url)
-            for entry in feed.entries[:5]:
-                deals.append(cls(entry))
+            entries = cache.get(feed_url, feed_entries) if cache else feed_entries(feed_url)
+            for entry in entries:
+                if skip and skip(cls.link(entry)):
+                    continue
+                content = cache.get(cls.link(entry), cls.page_content) if cache else None
+                deals.append(cls(entry, content=content))
                 time.sleep(0.05)
         return deals
 
+    @classmethod
+    async def fetch_async(cls, show_progress: bool = False, skip: Optional[Callable[[str], bool]] = None,
+                          cache: Optional[HttpCache] = None, **limits) -> List[Self]:
+        """
+        Retrieve all deals from the selected RSS feeds concurrently
+        Politeness is handled by the per-host limits of the AsyncScraper rather than a fixed pause
+        Deals are returned in the same order as the serial fetch; pages that fail are skipped
+        """
+        async with AsyncScraper(cache=cache, **limits) as scraper:
+            results = await asyncio.gather(*(scraper.get_parsed(url, feed_entries) for url in feeds),
+                                           return_exceptions=True)
+            entries = []
+            for feed_url, result in zip(feeds, results):
+                if isinstance(result, Exception):
+                    logging.warning(f"Failed to fetch feed {feed_url}: {result}")
+                else:
+                    entries.extend(entry for entry in result if not (skip and skip(cls.link(entry))))
+            progress = tqdm(total=len(entries)) if show_progress else None
+
+            async def build(entry):
+                try:
+                    content = await scraper.get_parsed(cls.link(entry), cls.page_content)
+                    return cls(entry, content=content)
+                except Exception as e:
+                    logging.warning(f"Failed to scrape {cls.link(entry)}: {e}")
+                    return None
+                finally:
+                    if progress:
+                        progress.update()
+
+            deals = await asyncio.gather(*(build(entry) for entry in entries))
+            if progress:
+                progress.close()
+        return [deal for deal in deals if deal]
+
 class Deal(BaseModel):
     """
     A class to Represent a Deal with a summary description
@@ -0,0 +1,133 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Union
+import numpy as np
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+class EmbeddingCache:
+    """
+    A persistent, content-addressed cache in front of a SentenceTransformer
+    Each text is keyed by a hash of the model name, the encode options that change the vectors (such as
+    normalize_embeddings), and the text with its whitespace normalized
+    Vectors are appended to a float32 file that is read through a memory map, and index.tsv maps keys to rows
+    Recently used vectors are also kept in an in-memory LRU, so repeated texts never reach the model
+    Use it in place of the model: cache.encode(texts) returns the same array that model.encode(texts) would
+    """
+
+    DIRECTORY = "embedding_cache"
+    CAPACITY = 10000
+    # encode options that only affect how the work is done, not the vectors, and so aren't part of the key
+    NEUTRAL_OPTIONS = {"batch_size", "show_progress_bar", "device"}
+
+    def __init__(self, model, model_name: str = MODEL_NAME, directory: str = DIRECTORY, capacity: int = CAPACITY):
+        self.model = model
+        self.model_name = model_name
+        self.dim = model.get_sentence_embedding_dimension()
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.lru = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        folder = os.path.join(directory, model_name.replace("/", "__"))
+        os.makedirs(folder, exist_ok=True)
+        self.vectors_path = os.path.join(folder, "vectors.f32")
+        self.index_path = os.path.join(folder, "index.tsv")
+        self.rows: Dict[str, int] = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as file:
+                for line in file:
+                    key, row = line.split()
+                    self.rows[key] = int(row)
+        self.vectors = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split())
+
+    def options(self, kwargs: Dict) -> str:
+        relevant = {name: value for name, value in kwargs.items() if name not in self.NEUTRAL_OPTIONS}
+        return json.dumps(relevant, sort_keys=True, default=str) if relevant else ""
+
+    def key(self, text: str, options: str = "") -> str:
+        # Plain encodes keep the keys they had before options were part of the key
+        parts = [self.model_name, options, self.normalize(text)] if options else [self.model_name, self.normalize(text)]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def row_count(self) -> int:
+        return os.path.getsize(self.vectors_path) // (4 * self.dim) if os.path.exists(self.vectors_path) else 0
+
+    def read(self, row: int) -> np.ndarray:
+        """
+        Read a vector from the file, remapping it if it has grown since we last mapped it
+        """
+        if self.vectors is None or row >= len(self.vectors):
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.row_count(), self.dim))
+        return np.array(self.vectors[row])
+
+    def remember(self, key: str, vector: np.ndarray) -> None:
+        self.lru[key] = vector
+        self.lru.move_to_end(key)
+        if len(self.lru) > self.capacity:
+            self.lru.popitem(last=False)
+
+    def append(self, keys: List[str], vectors: np.ndarray) -> None:
+        """
+        Append new vectors to the file, then record their rows in the index
+        """
+        first = self.row_count()
+        with open(self.vectors_path, "ab") as file:
+            file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        with open(self.index_path, "a") as file:
+            for offset, key in enumerate(keys):
+                self.rows[key] = first + offset
+                file.write(f"{key}\t{first + offset}\n")
+
+    def encode(self, texts: Union[str, List[str]], **kwargs) -> np.ndarray:
+        """
+        Return embeddings for these texts, only calling the model for texts we haven't seen before
+        """
+        single = isinstance(texts, str)
+        texts = [texts] if single else list(texts)
+        options = self.options(kwargs)
+        keys = [self.key(text, options) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+        with self.lock:
+            for i, key in enumerate(keys):
+                if key in self.lru:
+                    results[i] = self.lru[key]
+                    self.lru.move_to_end(key)
+                elif key in self.rows:
+                    results[i] = self.read(self.rows[key])
+                    self.remember(key, results[i])
+                else:
+                    missing.setdefault(key, []).append(i)
+            self.hits += len(texts) - sum(len(positions) for positions in missing.values())
+            self.misses += len(missing)
+        if missing:
+            new_keys = list(missing)
+            new_texts = [texts[missing[key][0]] for key in new_keys]
+            vectors = np.asarray(self.model.encode(new_texts, **kwargs), dtype=np.float32)
+            with self.lock:
+                fresh = [i for i, key in enumerate(new_keys) if key not in self.rows]
+                if fresh:
+                    self.append([new_keys[i] for i in fresh], vectors[fresh])
+                for key, vector in zip(new_keys, vectors):
+                    self.remember(key, vector)
+            for key, vector in zip(new_keys, vectors):
+                for i in missing[key]:
+                    results[i] = vector
+        embeddings = np.stack(results) if results else np.zeros((0, self.dim), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
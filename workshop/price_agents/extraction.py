@@ -0,0 +1,134 @@
+import os
+import re
+import html
+import importlib.util
+from html.parser import HTMLParser
+from typing import List, Optional, Union
+from bs4 import BeautifulSoup
+
+TAG = re.compile('<[^<]+?>')
+SKIPPED_TAGS = {'script', 'style', 'template'}
+CHUNK_SIZE = 16384
+
+BACKENDS = ['html.parser', 'lxml', 'partial']
+backend = os.getenv("DEAL_EXTRACTION_BACKEND", "html.parser")
+
+
+def available_backends() -> List[str]:
+    """
+    Return the backends that can be used here; lxml is only available if it's installed
+    """
+    return [name for name in BACKENDS if name != 'lxml' or importlib.util.find_spec('lxml')]
+
+
+def set_backend(name: str) -> None:
+    """
+    Select the backend used by default for all extraction
+    """
+    global backend
+    if name not in available_backends():
+        raise ValueError(f"Unknown or unavailable extraction backend: {name}")
+    backend = name
+
+
+class DivTextParser(HTMLParser):
+    """
+    A streaming parser that collects the text of the first div with a given class,
+    and stops as soon as that div is closed so the rest of the page is never parsed
+    """
+
+    def __init__(self, css_class: str):
+        super().__init__(convert_charrefs=True)
+        self.css_class = css_class
+        self.depth = 0
+        self.skipping = 0
+        self.done = False
+        self.found = False
+        self.strings = []
+
+    def matches(self, attrs) -> bool:
+        classes = dict(attrs).get('class') or ''
+        if ' ' in self.css_class:
+            return classes == self.css_class
+        return self.css_class in classes.split()
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if self.depth:
+            if tag == 'div':
+                self.depth += 1
+            elif tag in SKIPPED_TAGS:
+                self.skipping += 1
+        elif tag == 'div' and self.matches(attrs):
+            self.found = True
+            self.depth = 1
+
+    def handle_endtag(self, tag):
+        if not self.depth or self.done:
+            return
+        if tag in SKIPPED_TAGS and self.skipping:
+            self.skipping -= 1
+        elif tag == 'div':
+            self.depth -= 1
+            self.done = self.depth == 0
+
+    def handle_data(self, data):
+        if self.depth and not self.skipping and not self.done:
+            self.strings.append(data)
+
+    def parse(self, text: str) -> Optional[List[str]]:
+        """
+        Feed the text in chunks, starting near the first mention of the class, until the div is closed
+        """
+        mention = text.find(self.css_class)
+        start = max(text.rfind('<div', 0, mention), 0) if mention >= 0 else len(text)
+        for offset in range(start, len(text), CHUNK_SIZE):
+            self.feed(text[offset:offset + CHUNK_SIZE])
+            if self.done:
+                break
+        else:
+            self.close()
+        return self.strings if self.found else None
+
+
+def decode(markup: Union[str, bytes]) -> str:
+    return markup.decode('utf-8', errors='replace') if isinstance(markup, bytes) else markup
+
+
+def div_text(markup: Union[str, bytes], css_class: str, strip: bool = False, using: Optional[str] = None) -> Optional[str]:
+    """
+    Return the text of the first div with this class, or None if there isn't one
+    With strip=True, each string is stripped and empty strings dropped, as with BeautifulSoup's get_text(strip=True)
+    """
+    using = using or backend
+    if using == 'partial':
+        strings = DivTextParser(css_class).parse(decode(markup))
+        if strings is None:
+            return None
+        if strip:
+            strings = [s.strip() for s in strings if s.strip()]
+        return ''.join(strings)
+    div = BeautifulSoup(markup, using).find('div', class_=css_class)
+    return div.get_text(strip=strip) if div else None
+
+
+def snippet_text(html_snippet: str, using: Optional[str] = None) -> Optional[str]:
+    """
+    Extract the text of an RSS summary in a single parse
+    The summary's text can itself contain escaped markup, so strip tags either side of unescaping
+    """
+    text = div_text(html_snippet, 'snippet summary', strip=True, using=using)
+    if text is None:
+        return None
+    return TAG.sub('', html.unescape(TAG.sub('', text))).strip()
+
+
+def content_text(page: Union[str, bytes], using: Optional[str] = None) -> str:
+    """
+    Extract the text of the content section of a deal's detail page
+    """
+    text = div_text(page, 'content-section', using=using)
+    if text is None:
+        raise ValueError("No content-section found on page")
+    return text.replace('\nmore', '').replace('\n', ' ')
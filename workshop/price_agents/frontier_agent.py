@@ -2,7 +2,9 @@ import os
 import re
 import math
 import json
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from agents import AsyncOpenAI, OpenAIChatCompletionsModel
 from agents.run import RunConfig
 import google.generativeai as genai
@@ -14,8 +16,12 @@ import chromadb
 from items import Item
 from testing import Tester
 from price_agents.agent import Agent
+from price_agents.vector_index import ChromaRetriever, AnnRetriever, ProductIndex
+from price_agents.embedding_cache import EmbeddingCache
+from price_agents.preprocess import PreprocessCache, llm_preprocess, rules_preprocess
+from price_agents.hedging import hedged, HedgeError
+from price_agents.llm_gateway import get_gateway
 from dotenv import load_dotenv
-from openai import OpenAI
 
 load_dotenv()
 genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
@@ -27,11 +33,29 @@ class FrontierAgent(Agent):
 
     MODEL            = "gemini-2.5-chat"
     PREPROCESS_MODEL = "llama3.2"
+    WORKERS          = 5
+    RETRIEVAL        = "chroma"
+    INDEX_PRECISION  = "float32"
+    INDEX_RERANK     = 20
+    PREPROCESS_MODE  = "llm"
+    KNN_THRESHOLD    = None    # off until a GatedTester sweep has picked a threshold, e.g. 0.8
+    DISTANCE_SCALE   = 0.5
+    HEDGE_DELAY      = None    # opt in with a delay near Gemini's measured p95 latency, e.g. 3.0
 
-    def __init__(self, collection):
+    def __init__(self, collection, retrieval: str = RETRIEVAL, preprocess_mode: str = PREPROCESS_MODE,
+                 knn_threshold: Optional[float] = KNN_THRESHOLD, hedge_delay: Optional[float] = HEDGE_DELAY):
         """
         Set up this instance by connecting to Gemini for pricing,
         to the Chroma Datastore, and to local Ollama for preprocessing.
+        :param retrieval: "chroma" to query the collection, or "ann" to query an in-process ProductIndex
+        that is exported from the collection, and rebuilt whenever the collection's size changes
+        The index stores vectors at INDEX_PRECISION, re-ranking the best INDEX_RERANK candidates exactly
+        :param preprocess_mode: "llm" to rewrite descriptions with Ollama (cached on disk), or "rules" to skip
+        the LLM and apply the same scrub rules as the products in the datastore
+        :param knn_threshold: when the kNN estimate's confidence is at least this, return it and skip the LLM;
+        None to always call the LLM
+        :param hedge_delay: seconds to wait for Gemini before also asking Ollama, taking the first valid price;
+        None, the default, to only call Ollama once Gemini has failed
         """
         self.MODEL = "gemini-2.5-flash"
         self.log("Scanner Agent is initializing")
@@ -39,27 +63,41 @@ class FrontierAgent(Agent):
         gemini_api_key = os.getenv("GEMINI_API_KEY")
         if not gemini_api_key:
             raise RuntimeError("GEMINI_API_KEY missing in .env")
-        # use Google Gemini
-        self.openai = OpenAI(
-            api_key=gemini_api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-        )
+        # All LLM calls go through the shared gateway; the Agents SDK wrapper gets its pooled async client
+        self.gateway = get_gateway()
         # Wrap it in the OpenAIChatCompletionsModel for convenience:
         self.model = OpenAIChatCompletionsModel(
             model=self.MODEL,
-            openai_client=self.openai
+            openai_client=self.gateway.gemini_async
         )
         # (we won't need Runner here, but if you did:)
         self.run_config = RunConfig(
             model=self.model,
-            model_provider=self.openai,
+            model_provider=self.gateway.gemini_async,
             tracing_disabled=True
         )
         self.log("Frontier Agent is setting up with Gemini")
 
         # no longer import Ollama class; will invoke via ollama.run()
+        if preprocess_mode not in ("llm", "rules"):
+            raise ValueError(f"Unknown preprocess mode {preprocess_mode}")
+        self.preprocess_mode = preprocess_mode
+        self.knn_threshold = knn_threshold
+        self.hedge_delay = hedge_delay
+        self.knn_calls = 0
+        self.knn_skips = 0
+        self.knn_lock = threading.Lock()
+        self.preprocess_cache = PreprocessCache()
         self.collection = collection
-        self.model      = SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2')
+        if retrieval == "ann":
+            self.log("Frontier Agent is loading the in-process product index")
+            index = ProductIndex.load_or_build(collection, precision=self.INDEX_PRECISION, rerank=self.INDEX_RERANK)
+            self.retriever = AnnRetriever(index)
+        elif retrieval == "chroma":
+            self.retriever = ChromaRetriever(collection)
+        else:
+            raise ValueError(f"Unknown retrieval backend {retrieval}")
+        self.model      = EmbeddingCache(SentenceTransformer('sentence-transformers/all-MiniLM-L6-v2'))
         self.log("Frontier Agent is ready")
 
     def make_context(self, similars: List[str], prices: List[float]) -> str:
@@ -72,18 +110,21 @@ class FrontierAgent(Agent):
         return message
 
     def preprocess(self, item: str) -> str:
+        if self.preprocess_mode == "rules":
+            return rules_preprocess(item)
+        cached = self.preprocess_cache.get(self.PREPROCESS_MODEL, item)
+        if cached is not None:
+            self.log(f"Using cached preprocessing for input: {repr(item[:120])}")
+            return cached
         self.log(f"Calling Ollama locally with model={self.PREPROCESS_MODEL} on input: {repr(item[:120])}...")
         try:
-            messages = [
-                {'role': 'user', 'content': f"Rewrite this more concisely: {item}"}
-            ]
-            response = ollama.chat(model=self.PREPROCESS_MODEL, messages=messages)
-            result = response['message']['content']
+            result = llm_preprocess(item, self.PREPROCESS_MODEL)
             self.log(f"Ollama output: {repr(result[:300])}")
-            return result.strip()
         except Exception as e:
             self.log(f"Exception while calling Ollama: {e}")
             raise
+        self.preprocess_cache.put(self.PREPROCESS_MODEL, item, result)
+        return result
 
 
     def estimate_price_ollama(description: str) -> float:
@@ -106,20 +147,80 @@ class FrontierAgent(Agent):
         1) Preprocess via Ollama
         2) Embed & search ChromaDB for top 5
         """
-        self.log("Frontier Agent preprocessing with local Ollama")
-        preprocessed = self.preprocess(description)
+        return self.find_similars_many([description])[0]
+
+    def find_similars_many(self, descriptions: List[str]) -> List[Tuple[List[str], List[float]]]:
+        """
+        As find_similars, for a batch of descriptions
+        """
+        return [(documents, [m['price'] for m in metadatas]) for documents, metadatas, _ in self.neighbours_many(descriptions)]
+
+    def neighbours_many(self, descriptions: List[str]) -> List[Tuple[List[str], List[Dict], List[float]]]:
+        """
+        Preprocess the descriptions in parallel, embed them in one batch and search the datastore with a single query
+        Returns the documents, metadata and distances of the 5 nearest products to each description
+        """
+        self.log(f"Frontier Agent preprocessing {len(descriptions)} descriptions in {self.preprocess_mode} mode")
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            preprocessed = list(executor.map(self.preprocess, descriptions))
 
         self.log("Frontier Agent vectorizing with SentenceTransformer")
-        vector = self.model.encode([preprocessed])
+        vectors = self.model.encode(preprocessed)
 
-        self.log("Frontier Agent querying Chroma datastore")
-        results = self.collection.query(
-            query_embeddings=vector.astype(float).tolist(),
-            n_results=5
-        )
-        documents = results['documents'][0]
-        prices    = [m['price'] for m in results['metadatas'][0]]
-        return documents, prices
+        self.log("Frontier Agent querying the product datastore")
+        return self.retriever.query(vectors, n_results=5)
+
+    def knn_estimate(self, prices: List[float], distances: List[float]) -> Tuple[float, float]:
+        """
+        A similarity-weighted average of the neighbours' prices, with a confidence between 0 and 1
+        Confidence is high when the neighbours are close and their prices agree with each other
+        """
+        weights = [1.0 / (distance + 1e-6) for distance in distances]
+        total = sum(weights)
+        estimate = sum(w * p for w, p in zip(weights, prices)) / total
+        if estimate <= 0:
+            return estimate, 0.0
+        spread = math.sqrt(sum(w * (p - estimate) ** 2 for w, p in zip(weights, prices)) / total) / estimate
+        closeness = 1.0 / (1.0 + (sum(distances) / len(distances)) / self.DISTANCE_SCALE)
+        return estimate, closeness / (1.0 + spread)
+
+    def price_neighbours(self, description: str, neighbours: Tuple[List[str], List[Dict], List[float]]) -> float:
+        """
+        Price this product from its nearest neighbours: use the kNN estimate if we're confident in it,
+        otherwise ask the LLM
+        """
+        docs, metadatas, distances = neighbours
+        prices = [m['price'] for m in metadatas]
+        if self.knn_threshold is not None and prices:
+            estimate, confidence = self.knn_estimate(prices, distances)
+            skip = confidence >= self.knn_threshold
+            with self.knn_lock:
+                self.knn_calls += 1
+                self.knn_skips += skip
+            if skip:
+                self.log(f"Frontier Agent kNN predicts ${estimate:.2f} with confidence {confidence:.2f}; skipping LLM")
+                return estimate
+            self.log(f"Frontier Agent kNN confidence {confidence:.2f} is below threshold; calling LLM")
+        return self.estimate(description, docs, prices)
+
+    def category(self, neighbours: Tuple[List[str], List[Dict], List[float]]) -> Optional[str]:
+        """
+        The most common category among this product's nearest neighbours
+        """
+        categories = [m['category'] for m in neighbours[1] if m.get('category')]
+        return max(set(categories), key=categories.count) if categories else None
+
+    def knn_skip_rate(self) -> float:
+        return self.knn_skips / self.knn_calls if self.knn_calls else 0.0
+
+    def diagnose(self, description: str) -> Dict[str, float]:
+        """
+        Return both the kNN estimate with its confidence, and the LLM estimate, for tuning the threshold
+        """
+        docs, metadatas, distances = self.neighbours_many([description])[0]
+        prices = [m['price'] for m in metadatas]
+        knn, confidence = self.knn_estimate(prices, distances)
+        return {"knn": knn, "confidence": confidence, "llm": self.estimate(description, docs, prices)}
 
     def get_price(self, text: str) -> float:
         """
@@ -132,11 +233,32 @@ class FrontierAgent(Agent):
     def price(self, description: str) -> float:
         """
         1) Find 5 similar products
-        2) Call Gemini or DeepSeek for a price estimate
-        3) If it fails, fallback to local Ollama
+        2) If the kNN estimate from their prices is confident enough, use it
+        3) Otherwise call Gemini or DeepSeek for a price estimate
+        4) If it fails, fallback to local Ollama
         """
-        docs, prices = self.find_similars(description)
+        return self.price_neighbours(description, self.neighbours_many([description])[0])
 
+    def price_many(self, descriptions: List[str], neighbours: Optional[List] = None) -> List[float]:
+        """
+        Price a batch of products: one batched embedding and one Chroma query for all of them,
+        then the LLM calls fanned out in parallel
+        :param neighbours: the results of neighbours_many for these descriptions, if already looked up
+        """
+        if not descriptions:
+            return []
+        neighbours = neighbours or self.neighbours_many(descriptions)
+        with ThreadPoolExecutor(max_workers=self.WORKERS) as executor:
+            futures = [executor.submit(self.price_neighbours, description, found)
+                       for description, found in zip(descriptions, neighbours)]
+            return [future.result() for future in futures]
+
+    def estimate(self, description: str, docs: List[str], prices: List[float]) -> float:
+        """
+        Call the LLM for a price estimate given the similar products, falling back to local Ollama
+        With hedge_delay set, Ollama is started if Gemini hasn't answered within that many seconds,
+        and whichever returns a valid price first wins
+        """
         self.log("Frontier Agent calling LLM for price estimate")
         messages = [
             {"role": "system",  "content": "You estimate prices. Reply with only the numeric price."},
@@ -144,38 +266,41 @@ class FrontierAgent(Agent):
         ]
         self.log(f"LLM raw request: {messages}")
 
+        if self.hedge_delay is not None:
+            try:
+                return hedged(lambda: self.estimate_gemini(messages), lambda: self.estimate_ollama(description),
+                              self.hedge_delay, valid=lambda result: result > 0, log=self.log)
+            except HedgeError as e:
+                self.log(f"❌ {e}")
+                return 0.0
         try:
-            resp = self.openai.chat.completions.create(
-                model=self.MODEL,
-                messages=messages,
-                max_tokens=10
-            )
-            self.log(f"LLM raw resp: {resp}")
-            reply = resp.choices[0].message.content
-            # If we get no reply, raise error to trigger fallback
-            if not reply:
-                raise ValueError("No reply from Gemini")
-            result = self.get_price(reply)
-            self.log(f"Frontier Agent predicts ${result:.2f}")
-            return result
+            return self.estimate_gemini(messages)
         except Exception as e:
             self.log(f"❌ Gemini failed: {e}. Falling back to Ollama local model...")
-            # Fallback to local Ollama inference
-            prompt = (
-                "You are an expert product pricer. Reply with only the numeric price in USD, no extra text.\n\n"
-                f"Product: {description}"
-            )
             try:
-                response = ollama.chat(
-                    model="llama3.2",  # Use your preferred Ollama model
-                    messages=[{"role": "user", "content": prompt}]
-                )
-                reply = response['message']['content'].strip()
-                match = re.search(r"[-+]?\d*\.\d+|\d+", reply)
-                result = float(match.group()) if match else 0.0
-                self.log(f"Ollama local predicts ${result:.2f}")
-                return result
+                return self.estimate_ollama(description)
             except Exception as ollama_err:
                 self.log(f"❌ Ollama fallback also failed: {ollama_err}")
                 return 0.0
 
+    def estimate_gemini(self, messages: List[Dict[str, str]]) -> float:
+        reply = self.gateway.gemini_chat(self.MODEL, messages, use_cache=True, max_tokens=10)
+        self.log(f"LLM raw resp: {reply}")
+        # If we get no reply, raise error to trigger fallback
+        if not reply:
+            raise ValueError("No reply from Gemini")
+        result = self.get_price(reply)
+        self.log(f"Frontier Agent predicts ${result:.2f}")
+        return result
+
+    def estimate_ollama(self, description: str) -> float:
+        prompt = (
+            "You are an expert product pricer. Reply with only the numeric price in USD, no extra text.\n\n"
+            f"Product: {description}"
+        )
+        reply = self.gateway.ollama_chat([{"role": "user", "content": prompt}], use_cache=True).strip()
+        match = re.search(r"[-+]?\d*\.\d+|\d+", reply)
+        result = float(match.group()) if match else 0.0
+        self.log(f"Ollama local predicts ${result:.2f}")
+        return result
+
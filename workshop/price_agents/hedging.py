@@ -0,0 +1,56 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Shared by every hedged call, so that a losing request can finish in the background
+# without holding up the caller the way leaving a `with ThreadPoolExecutor()` block would
+EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+class HedgeError(RuntimeError):
+    """
+    Raised when neither the primary nor the fallback produced a valid answer
+    """
+
+
+def hedged(primary: Callable[[], T], fallback: Callable[[], T], delay: float,
+           valid: Callable[[T], bool] = lambda result: result is not None,
+           log: Optional[Callable[[str], None]] = None) -> T:
+    """
+    Run primary, and if it hasn't returned a valid answer within delay seconds, start fallback alongside it
+    The fallback also starts straight away if the primary fails or returns something invalid before then
+    Whichever valid answer arrives first is returned; the other call is cancelled if it hasn't started,
+    otherwise its result is ignored when it eventually completes
+    :param delay: seconds to give the primary on its own
+    :param valid: test applied to each result; an exception counts as invalid
+    :param log: optional function to report when the fallback is started and which call won
+    :return: the first valid result
+    """
+    primary_future = EXECUTOR.submit(primary)
+    pending = {primary_future}
+    fallback_future = None
+    errors = []
+    while pending:
+        done, pending = wait(pending, timeout=delay if fallback_future is None else None,
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                errors.append(e)
+                continue
+            if valid(result):
+                for loser in pending:
+                    loser.cancel()
+                if log:
+                    log(f"Hedged call answered by the {'primary' if future is primary_future else 'fallback'}")
+                return result
+            errors.append(ValueError(f"Invalid result: {result!r}"))
+        if fallback_future is None:
+            if log:
+                reason = "Primary failed" if done else f"Primary hasn't answered in {delay}s"
+                log(f"{reason}; starting the fallback")
+            fallback_future = EXECUTOR.submit(fallback)
+            pending.add(fallback_future)
+    raise HedgeError(f"No valid answer from primary or fallback: {errors}")
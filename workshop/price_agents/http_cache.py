@@ -0,0 +1,114 @@
+import os
+import json
+import hashlib
+from typing import Any, Callable, Dict, Optional
+import requests
+
+TIMEOUT = 20
+
+
+class HttpCache:
+    """
+    An on-disk cache for HTTP GETs that supports conditional requests
+    For each URL we store the ETag and Last-Modified validators, a hash of the body, and the parsed result
+    A 304 response, or a 200 whose body hashes the same as last time, returns the stored result without re-parsing
+    A 304 when we have nothing stored, e.g. after the record was deleted, means the url must be fetched again
+    without the conditional headers
+    Parsed results must be JSON serializable
+    """
+
+    DIRECTORY = "http_cache"
+
+    def __init__(self, directory: str = DIRECTORY):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.unchanged = 0
+        self.misses = 0
+
+    def path_for(self, url: str) -> str:
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name + ".json")
+
+    def load(self, url: str) -> Optional[Dict]:
+        path = self.path_for(url)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, url: str, record: Dict) -> None:
+        path = self.path_for(url)
+        temp = path + ".tmp"
+        with open(temp, "w") as file:
+            json.dump(record, file)
+        os.replace(temp, path)
+
+    def headers(self, url: str) -> Dict[str, str]:
+        """
+        Return the conditional request headers for this url, if we have validators for it
+        """
+        record = self.load(url)
+        headers = {}
+        if record:
+            if record.get("etag"):
+                headers["If-None-Match"] = record["etag"]
+            if record.get("last_modified"):
+                headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def needs_refetch(self, url: str, status: int) -> bool:
+        """
+        Whether this response was a 304 that we have no stored result for
+        """
+        return status == 304 and self.load(url) is None
+
+    def resolve(self, url: str, status: int, headers: Dict[str, str], body: bytes, parse: Callable[[bytes], Any]) -> Any:
+        """
+        Turn a response into a parsed result, using the stored result whenever the content hasn't changed
+        """
+        record = self.load(url)
+        if status == 304:
+            if not record:
+                raise ValueError(f"Got 304 Not Modified for {url} with nothing cached; fetch it unconditionally")
+            self.hits += 1
+            return record["parsed"]
+        body_hash = hashlib.sha256(body).hexdigest()
+        if record and record.get("body_hash") == body_hash:
+            self.unchanged += 1
+            parsed = record["parsed"]
+        else:
+            self.misses += 1
+            parsed = parse(body)
+        self.save(url, {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "body_hash": body_hash,
+            "parsed": parsed,
+        })
+        return parsed
+
+    def get(self, url: str, parse: Callable[[bytes], Any]) -> Any:
+        """
+        Make a conditional GET for this url and return the parsed result
+        """
+        response = requests.get(url, headers=self.headers(url), timeout=TIMEOUT)
+        if self.needs_refetch(url, response.status_code):
+            response = requests.get(url, timeout=TIMEOUT)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return self.resolve(url, response.status_code, response.headers, response.content, parse)
+
+    def stats(self) -> Dict[str, int]:
+        total = self.hits + self.unchanged + self.misses
+        return {
+            "requests": total,
+            "not_modified": self.hits,
+            "unchanged": self.unchanged,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.unchanged) / total if total else 0.0,
+        }
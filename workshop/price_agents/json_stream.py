@@ -0,0 +1,226 @@
+import json
+from typing import Dict, List, Optional
+from price_agents.deals import Deal, DealSelection
+
+CLOSERS = {"{": "}", "[": "]"}
+
+
+class JsonObjectStream:
+    """
+    Incrementally parses streamed JSON text, such as an LLM response arriving in chunks,
+    and returns each object in an array as soon as its closing brace arrives
+    For {"deals": [{...}, {...}]} this yields each deal dict without waiting for the rest of the response
+    Anything outside the JSON, like markdown fences, is ignored
+    It tolerates the mistakes LLMs make: a double quote inside a string that isn't followed by
+    something that could come after a string, like 14" TV, is taken as part of the text and escaped,
+    and when the response is cut short, finish() closes the last object after its last complete field
+    Objects that can't be parsed or repaired are counted in failed; with a key, only the objects in the array
+    under that key of the top-level object are returned, and any others are counted in misplaced
+    """
+
+    def __init__(self, key: Optional[str] = None):
+        """
+        :param key: the key of the top-level object's array to return objects from, or None for any array
+        """
+        self.key = key
+        self.buffer = ""
+        self.position = 0
+        self.out = []
+        self.stack = []
+        self.array_keys = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = 0
+        self.last_string = None
+        self.start = None
+        self.start_depth = 0
+        self.start_key = None
+        self.failed = 0
+        self.misplaced = 0
+
+    def next_char(self, i: int) -> Optional[int]:
+        """
+        The index of the next non-whitespace character in the buffer from i, or None if we haven't received it yet
+        """
+        while i < len(self.buffer) and self.buffer[i].isspace():
+            i += 1
+        return i if i < len(self.buffer) else None
+
+    def closes_string(self, i: int, final: bool) -> Optional[bool]:
+        """
+        Decide whether the quote at i ends the current string, by looking at what follows it
+        :return: True or False, or None if we need more text to know
+        """
+        after = self.next_char(i + 1)
+        if after is None:
+            return True if final else None
+        char = self.buffer[after]
+        if char in ":}]":
+            return True
+        if char != ",":
+            return False
+        following = self.next_char(after + 1)
+        if following is None:
+            return True if final else None
+        if self.stack[-1] == "{":
+            return self.buffer[following] == '"'
+        return self.buffer[following] in '"{[-0123456789tfn'
+
+    def process(self, final: bool) -> List[str]:
+        """
+        Scan the new text in the buffer, copying it to out with any stray quotes escaped
+        :return: the text of each array element object that was completed
+        """
+        completed = []
+        i = self.position
+        while i < len(self.buffer):
+            char = self.buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    closes = self.closes_string(i, final)
+                    if closes is None:
+                        break
+                    if closes:
+                        self.in_string = False
+                        self.last_string = "".join(self.out[self.string_start:])
+                    else:
+                        char = '\\"'
+            elif char == '"' and self.stack:
+                self.in_string = True
+                self.string_start = len(self.out) + 1
+            elif char in "{[":
+                if char == "{" and self.start is None and self.stack and self.stack[-1] == "[":
+                    self.start = len(self.out)
+                    self.start_depth = len(self.stack)
+                    self.start_key = self.array_keys[-1]
+                if char == "[":
+                    # the key of an array is the last string before it, when it's a value in an object
+                    self.array_keys.append(self.last_string if self.stack and self.stack[-1] == "{" else None)
+                self.stack.append(char)
+            elif char in "}]" and self.stack:
+                if self.stack.pop() == "[":
+                    self.array_keys.pop()
+                if self.start is not None and len(self.stack) == self.start_depth:
+                    if self.in_place():
+                        completed.append("".join(self.out[self.start:]) + char)
+                    else:
+                        self.misplaced += 1
+                    self.start = None
+            self.out.append(char)
+            i += 1
+        self.position = i
+        return completed
+
+    def in_place(self) -> bool:
+        """
+        Whether the object being completed is in the array we're returning objects from
+        """
+        return self.key is None or (self.start_depth == 2 and self.stack[0] == "{" and self.start_key == self.key)
+
+    def loads(self, texts: List[str]) -> List[Dict]:
+        objects = []
+        for text in texts:
+            try:
+                objects.append(json.loads(text, strict=False))
+            except ValueError:
+                self.failed += 1
+        return objects
+
+    def feed(self, chunk: str) -> List[Dict]:
+        """
+        Add the next chunk of text, and return any objects that it completed
+        """
+        self.buffer += chunk
+        return self.loads(self.process(final=False))
+
+    @staticmethod
+    def closing(text: str) -> Optional[str]:
+        """
+        The brackets that would close this JSON text, or None if it ends inside a string
+        """
+        stack, in_string, escape = [], False, False
+        for char in text:
+            if in_string:
+                if escape:
+                    escape = False
+                elif char == "\\":
+                    escape = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                stack.append(char)
+            elif char in "}]" and stack:
+                stack.pop()
+        return None if in_string else "".join(CLOSERS[char] for char in reversed(stack))
+
+    @classmethod
+    def repair(cls, text: str) -> Optional[Dict]:
+        """
+        Parse a truncated object, cutting it back a field at a time until what's left can be closed
+        """
+        while text:
+            closing = cls.closing(text)
+            if closing is not None:
+                try:
+                    return json.loads(text + closing, strict=False)
+                except ValueError:
+                    pass
+            cut = text.rfind(",")
+            if cut <= 0:
+                return None
+            text = text[:cut]
+        return None
+
+    def finish(self) -> List[Dict]:
+        """
+        Call once the response is complete, to return any objects still open, repaired if it was cut short
+        """
+        objects = self.loads(self.process(final=True))
+        if self.start is not None:
+            repaired = self.repair("".join(self.out[self.start:])) if self.in_place() else None
+            if repaired is not None:
+                objects.append(repaired)
+            elif self.in_place():
+                self.failed += 1
+            else:
+                self.misplaced += 1
+            self.start = None
+        return objects
+
+
+class DealStream:
+    """
+    Validates a streamed response against the DealSelection schema, deal by deal: only objects in the
+    top-level "deals" array are taken, and each must be a valid Deal
+    rejected counts every deal left out: unparseable, outside the "deals" array, or not a valid Deal
+    """
+
+    def __init__(self):
+        self.objects = JsonObjectStream(key="deals")
+        self.invalid = 0
+
+    @property
+    def rejected(self) -> int:
+        return self.invalid + self.objects.failed + self.objects.misplaced
+
+    def validate(self, items: List[Dict]) -> List[Deal]:
+        deals = []
+        for item in items:
+            try:
+                deals.extend(DealSelection(deals=[item]).deals)
+            except Exception:
+                self.invalid += 1
+        return deals
+
+    def feed(self, chunk: str) -> List[Deal]:
+        return self.validate(self.objects.feed(chunk))
+
+    def finish(self) -> List[Deal]:
+        return self.validate(self.objects.finish())
+
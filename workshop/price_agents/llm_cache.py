@@ -0,0 +1,82 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+
+class ResponseCache:
+    """
+    A persistent SQLite cache of LLM replies, keyed by the model plus a canonical hash of the messages and parameters
+    Entries expire after their TTL, and once there are more than max_entries the least recently used are evicted
+    Each entry remembers the tokens its call used, so that hits can be reported as tokens saved
+    """
+
+    FILENAME = "llm_cache.db"
+    TTL = 24 * 60 * 60
+    MAX_ENTRIES = 20000
+
+    def __init__(self, filename: str = FILENAME, ttl: Optional[float] = TTL, max_entries: int = MAX_ENTRIES):
+        """
+        :param ttl: default seconds before an entry expires; None to keep entries until they're evicted
+        :param max_entries: the most entries to keep
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, model TEXT NOT NULL, response TEXT NOT NULL,
+            tokens INTEGER NOT NULL, expires REAL, used REAL NOT NULL)""")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_used ON responses (used)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, str]], params: Optional[Dict] = None) -> str:
+        canonical = json.dumps({"messages": messages, "params": params or {}}, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(f"{model}\0{canonical}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute("SELECT response, tokens, expires FROM responses WHERE key = ?",
+                                          (key,)).fetchone()
+            if row and row[2] is not None and row[2] < now:
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.connection.commit()
+                row = None
+            if row:
+                self.connection.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+                self.connection.commit()
+                self.hits += 1
+                self.tokens_saved += row[1]
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, key: str, model: str, response: str, tokens: int = 0, ttl: Optional[float] = None) -> None:
+        """
+        Store a reply, expiring it after ttl seconds (by default the cache's ttl), and evict to stay within bounds
+        """
+        now = time.time()
+        ttl = ttl if ttl is not None else self.ttl
+        expires = now + ttl if ttl is not None else None
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO responses (key, model, response, tokens, expires, used) "
+                                    "VALUES (?, ?, ?, ?, ?, ?)", (key, model, response, tokens, expires, now))
+            self.connection.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires < ?", (now,))
+            self.connection.execute("DELETE FROM responses WHERE key IN "
+                                    "(SELECT key FROM responses ORDER BY used DESC LIMIT -1 OFFSET ?)",
+                                    (self.max_entries,))
+            self.connection.commit()
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            entries = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            total = self.hits + self.misses
+            return {"entries": entries, "hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0, "tokens_saved": self.tokens_saved}
@@ -0,0 +1,327 @@
+import os
+import json
+import time
+import queue
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI, AsyncOpenAI
+from price_agents.llm_cache import ResponseCache
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "127.0.0.1:11436")
+OLLAMA_URL = OLLAMA_HOST if OLLAMA_HOST.startswith("http") else f"http://{OLLAMA_HOST}"
+OLLAMA_MODEL = "llama3.2"
+
+
+class CircuitOpen(RuntimeError):
+    """
+    Raised instead of calling Gemini while its circuit breaker is open
+    """
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket allowing `rate` calls per minute on average, in bursts of up to `capacity`
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate / 60
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """
+        Take a token, sleeping until one is available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failures, so that callers can skip straight to their fallback
+    Once `cooldown` seconds have passed, a single trial call is let through: success closes the circuit,
+    and failure opens it for another cooldown
+    """
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if not self.trial and time.monotonic() - self.opened_at >= self.cooldown:
+                self.trial = True
+                return True
+            return False
+
+    def success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+    @property
+    def state(self) -> str:
+        with self.lock:
+            if self.opened_at is None:
+                return "closed"
+            return "half-open" if self.trial else "open"
+
+
+class LLMGateway:
+    """
+    The single way out to our LLMs, shared by every agent in the process
+    Gemini is reached through pooled keep-alive OpenAI clients, and Ollama through a pooled requests Session
+    Every call holds a slot of a global concurrency limit, Gemini calls take a token from their model's bucket,
+    and after repeated Gemini failures the circuit breaker fails Gemini calls at once, so callers go straight to Ollama
+    Non-streaming calls that opt in with use_cache=True keep their replies in a persistent ResponseCache,
+    so repeating an identical call costs nothing; call sites whose prompts can go stale leave it off
+    """
+
+    MAX_CONCURRENCY = 8
+    POOL_SIZE = 16
+    GEMINI_TIMEOUT = 30.0
+    OLLAMA_TIMEOUT = 120.0
+    RATE_LIMITS = {"gemini-2.5-flash": 10, "gemini-2.5-flash-lite": 15}
+    FAILURE_THRESHOLD = 3
+    COOLDOWN = 30.0
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, rate_limits: Optional[Dict[str, float]] = None,
+                 api_key: Optional[str] = None, cache: Optional[ResponseCache] = None, bypass_cache: bool = False):
+        """
+        :param max_concurrency: the most LLM calls in flight at once, across Gemini and Ollama
+        :param rate_limits: requests per minute by Gemini model; models not listed aren't limited
+        :param api_key: the Gemini key, by default GEMINI_API_KEY; only needed once Gemini is called
+        :param cache: the response cache, by default one in llm_cache.db
+        :param bypass_cache: True to neither read nor write the cache on any call
+        """
+        self.api_key = api_key
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.buckets = {model: TokenBucket(rate) for model, rate in (rate_limits or self.RATE_LIMITS).items()}
+        self.breaker = CircuitBreaker(self.FAILURE_THRESHOLD, self.COOLDOWN)
+        self.cache = cache or ResponseCache()
+        self.bypass_cache = bypass_cache
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=self.POOL_SIZE))
+        self.lock = threading.Lock()
+        self._gemini = None
+        self._gemini_async = None
+        self.counts = {"gemini": 0, "gemini_failures": 0, "short_circuits": 0, "ollama": 0}
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.counts[key] += 1
+
+    def require_key(self) -> str:
+        api_key = self.api_key or os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise RuntimeError("GEMINI_API_KEY missing in .env")
+        return api_key
+
+    @property
+    def gemini(self) -> OpenAI:
+        """
+        The shared synchronous client for Gemini's OpenAI-compatible endpoint
+        """
+        with self.lock:
+            if self._gemini is None:
+                self._gemini = OpenAI(api_key=self.require_key(), base_url=GEMINI_BASE_URL,
+                                      timeout=self.GEMINI_TIMEOUT, max_retries=1)
+            return self._gemini
+
+    @property
+    def gemini_async(self) -> AsyncOpenAI:
+        """
+        The shared async client, for the Agents SDK; calls made by the SDK bypass the limits and breaker
+        """
+        with self.lock:
+            if self._gemini_async is None:
+                self._gemini_async = AsyncOpenAI(api_key=self.require_key(), base_url=GEMINI_BASE_URL,
+                                                 timeout=self.GEMINI_TIMEOUT, max_retries=1)
+            return self._gemini_async
+
+    def admit(self, model: str) -> None:
+        """
+        Raise CircuitOpen if Gemini is failing, otherwise wait for the model's rate limit
+        """
+        if not self.breaker.allow():
+            self.count("short_circuits")
+            raise CircuitOpen(f"Gemini circuit is open after {self.breaker.failures} failures")
+        bucket = self.buckets.get(model)
+        if bucket:
+            bucket.acquire()
+
+    def cached(self, model: str, messages: List[Dict[str, str]], params: Dict, use_cache: bool,
+               ttl: Optional[float], call: Callable[[], Tuple[str, int]]) -> str:
+        """
+        Return the cached reply for this call if there is one, otherwise make the call and cache a non-empty reply
+        :param call: makes the call, returning the reply and the number of tokens it used
+        """
+        if self.bypass_cache or not use_cache:
+            return call()[0]
+        key = self.cache.key(model, messages, params)
+        reply = self.cache.get(key)
+        if reply is not None:
+            return reply
+        reply, tokens = call()
+        if reply:
+            self.cache.put(key, model, reply, tokens, ttl)
+        return reply
+
+    def gemini_chat(self, model: str, messages: List[Dict[str, str]], use_cache: bool = False,
+                    ttl: Optional[float] = None, **kwargs) -> str:
+        """
+        Call Gemini and return the reply's content
+        :param use_cache: True to serve this call from the response cache, and cache its reply
+        :param ttl: seconds to cache the reply for, by default the cache's TTL
+        """
+        def call() -> Tuple[str, int]:
+            self.admit(model)
+            self.count("gemini")
+            with self.semaphore:
+                try:
+                    response = self.gemini.chat.completions.create(model=model, messages=messages, **kwargs)
+                except Exception:
+                    self.count("gemini_failures")
+                    self.breaker.failure()
+                    raise
+            self.breaker.success()
+            tokens = response.usage.total_tokens if response.usage else 0
+            return response.choices[0].message.content or "", tokens
+
+        return self.cached(model, messages, kwargs, use_cache, ttl, call)
+
+    def gemini_stream(self, model: str, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """
+        Call Gemini with streaming, yielding each piece of content as it arrives
+        """
+        self.admit(model)
+        self.count("gemini")
+
+        def read() -> Iterator[str]:
+            try:
+                for chunk in self.gemini.chat.completions.create(model=model, messages=messages, stream=True,
+                                                                 **kwargs):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            except Exception:
+                self.count("gemini_failures")
+                self.breaker.failure()
+                raise
+            self.breaker.success()
+
+        yield from self.drain(read)
+
+    def drain(self, read: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """
+        Read a streamed response on a background thread that holds the concurrency slot, handing each piece
+        over a queue, so the slot is freed as soon as the response ends however slowly the caller consumes it
+        """
+        pieces = queue.Queue()
+        end = object()
+
+        def reader() -> None:
+            try:
+                with self.semaphore:
+                    for piece in read():
+                        pieces.put(piece)
+            except Exception as e:
+                pieces.put(e)
+            finally:
+                pieces.put(end)
+
+        threading.Thread(target=reader, daemon=True).start()
+        while (piece := pieces.get()) is not end:
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+
+    def ollama_payload(self, model: str, messages: List[Dict[str, str]], stream: bool, options: Dict) -> Dict:
+        payload = {"model": model, "messages": messages, "stream": stream}
+        if options:
+            payload["options"] = options
+        return payload
+
+    def ollama_chat(self, messages: List[Dict[str, str]], model: str = OLLAMA_MODEL,
+                    timeout: Optional[float] = None, use_cache: bool = False, ttl: Optional[float] = None,
+                    **options) -> str:
+        """
+        Call local Ollama and return the reply's content; any options are passed through as Ollama options
+        :param use_cache: True to serve this call from the response cache, and cache its reply
+        :param ttl: seconds to cache the reply for, by default the cache's TTL
+        """
+        def call() -> Tuple[str, int]:
+            self.count("ollama")
+            with self.semaphore:
+                response = self.session.post(f"{OLLAMA_URL}/api/chat",
+                                             json=self.ollama_payload(model, messages, False, options),
+                                             timeout=timeout or self.OLLAMA_TIMEOUT)
+            response.raise_for_status()
+            result = response.json()
+            tokens = result.get("prompt_eval_count", 0) + result.get("eval_count", 0)
+            return result.get("message", {}).get("content", ""), tokens
+
+        return self.cached(f"ollama/{model}", messages, options, use_cache, ttl, call)
+
+    def ollama_stream(self, messages: List[Dict[str, str]], model: str = OLLAMA_MODEL, **options) -> Iterator[str]:
+        """
+        Call local Ollama with streaming, yielding each piece of content from its NDJSON response
+        """
+        self.count("ollama")
+
+        def read() -> Iterator[str]:
+            with self.session.post(f"{OLLAMA_URL}/api/chat", json=self.ollama_payload(model, messages, True, options),
+                                   stream=True, timeout=self.OLLAMA_TIMEOUT) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line).get("message", {}).get("content", "")
+
+        yield from self.drain(read)
+
+    def stats(self) -> Dict:
+        with self.lock:
+            counts = dict(self.counts)
+        return {**counts, "circuit": self.breaker.state, "cache": self.cache.stats()}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """
+    Return the process-wide gateway, creating it on first use
+    Set LLM_CACHE_BYPASS=1 to run without the response cache
+    """
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway(bypass_cache=os.getenv("LLM_CACHE_BYPASS") == "1")
+        return _gateway
@@ -3,7 +3,7 @@ from price_agents.deals import Opportunity
 import http.client
 import urllib
 from price_agents.agent import Agent
-import requests
+from price_agents.llm_gateway import get_gateway
 
 class MessagingAgent(Agent):
 
@@ -48,18 +48,12 @@ class MessagingAgent(Agent):
             f"Estimated true value: {estimated_true_value}\n\n"
             "Respond only with the 2-3 sentence message which will be used to alert the user about this deal."
         )
-        payload = {
-            "model": "llama3.2",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        }
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
         try:
-            resp = requests.post("http://127.0.0.1:11436/api/chat", json=payload, timeout=20)
-            resp.raise_for_status()
-            result = resp.json()
-            content = result.get("message", {}).get("content", "").strip()
+            content = get_gateway().ollama_chat(messages, model="llama3.2", timeout=20).strip()
             return content or "Great deal available!"
         except Exception as e:
             self.log(f"❌ Ollama message crafting failed: {e}")
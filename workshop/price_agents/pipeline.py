@@ -0,0 +1,150 @@
+import time
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from price_agents.agent import Agent
+
+DONE = object()
+
+
+class Stage:
+    """
+    One stage of a Pipeline: a pool of worker threads reading from a bounded inbox
+    The handler takes one item and returns an iterable of items for the next stage
+    A batch stage has a single worker whose handler is given a list of every item that arrives
+    """
+
+    def __init__(self, name: str, handler: Callable[[Any], Iterable], workers: int = 1, capacity: int = 16,
+                 batch: bool = False):
+        self.name = name
+        self.handler = handler
+        self.workers = 1 if batch else workers
+        self.batch = batch
+        self.inbox = queue.Queue(maxsize=capacity)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.running = self.workers
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy = 0.0
+
+    def stats(self, elapsed: float) -> Dict[str, float]:
+        """
+        Return the queue depth and throughput of this stage
+        """
+        return {
+            "workers": self.workers,
+            "queue_depth": self.inbox.qsize(),
+            "processed": self.processed,
+            "emitted": self.emitted,
+            "errors": self.errors,
+            "throughput": self.processed / elapsed if elapsed else 0.0,
+            "utilization": self.busy / (elapsed * self.workers) if elapsed else 0.0,
+        }
+
+
+class Pipeline(Agent):
+    """
+    A staged execution runtime: each Stage has its own worker pool, and stages are connected by bounded queues
+    so that a slow stage applies backpressure upstream rather than letting work pile up in memory
+    """
+
+    name = "Pipeline"
+    color = Agent.BLUE
+
+    def __init__(self, stages: List[Stage], monitor_interval: Optional[float] = None):
+        self.stages = stages
+        self.monitor_interval = monitor_interval
+        self.results = []
+        self.started = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started if self.started else 0.0
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        elapsed = self.elapsed()
+        return {stage.name: stage.stats(elapsed) for stage in self.stages}
+
+    def emit(self, index: int, items: Iterable) -> None:
+        stage = self.stages[index]
+        for item in items:
+            with stage.lock:
+                stage.emitted += 1
+            if index + 1 < len(self.stages):
+                self.stages[index + 1].inbox.put(item)
+            else:
+                self.results.append(item)
+
+    def handle(self, index: int, item: Any) -> None:
+        stage = self.stages[index]
+        start = time.monotonic()
+        try:
+            self.emit(index, stage.handler(item) or [])
+        except Exception as e:
+            with stage.lock:
+                stage.errors += 1
+            self.log(f"Stage {stage.name} failed: {e}")
+        with stage.lock:
+            stage.processed += len(item) if stage.batch else 1
+            stage.busy += time.monotonic() - start
+
+    def work(self, index: int) -> None:
+        """
+        The loop run by each worker thread of a stage
+        The last worker to see the end of its input passes the end marker on to the next stage
+        """
+        stage = self.stages[index]
+        batch = []
+        while True:
+            item = stage.inbox.get()
+            if item is DONE:
+                break
+            if stage.batch:
+                batch.append(item)
+            else:
+                self.handle(index, item)
+        if stage.batch and batch:
+            self.handle(index, batch)
+        with stage.lock:
+            stage.running -= 1
+            last = stage.running == 0
+        if not last:
+            stage.inbox.put(DONE)
+        elif index + 1 < len(self.stages):
+            self.stages[index + 1].inbox.put(DONE)
+
+    def monitor(self, finished: threading.Event) -> None:
+        while not finished.wait(self.monitor_interval):
+            depths = ", ".join(f"{stage.name}={stage.inbox.qsize()}" for stage in self.stages)
+            self.log(f"Queue depths: {depths}")
+
+    def run(self, inputs: Iterable) -> List:
+        """
+        Feed these inputs into the first stage, run every stage until all work has drained,
+        and return whatever the final stage emitted
+        """
+        self.results = []
+        self.started = time.monotonic()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage.reset()
+            for n in range(stage.workers):
+                thread = threading.Thread(target=self.work, args=(index,), name=f"{stage.name}-{n}", daemon=True)
+                thread.start()
+                threads.append(thread)
+        finished = threading.Event()
+        if self.monitor_interval:
+            threading.Thread(target=self.monitor, args=(finished,), daemon=True).start()
+        for item in inputs:
+            self.stages[0].inbox.put(item)
+        self.stages[0].inbox.put(DONE)
+        for thread in threads:
+            thread.join()
+        finished.set()
+        for name, stats in self.stats().items():
+            self.log(f"Stage {name}: processed {stats['processed']} at {stats['throughput']:.2f}/s, "
+                     f"{stats['errors']} errors")
+        return self.results
@@ -1,27 +1,59 @@
-from typing import Optional, List
+import time
+from typing import Dict, Iterator, Optional, List, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError
 from price_agents.agent import Agent as BaseAgent
-from price_agents.deals import ScrapedDeal, DealSelection, Deal, Opportunity
+from price_agents.deals import ScrapedDeal, DealSelection, Deal, Opportunity, feeds, feed_entries
+from price_agents.pipeline import Pipeline, Stage
 from price_agents.scanner_agent import ScannerAgent
 from price_agents.frontier_agent import FrontierAgent
 from price_agents.specialist_agent import SpecialistAgent
 from price_agents.messaging_agent import MessagingAgent
+from price_agents.cascade import CascadeEstimator
 
 
 class PlanningAgent(BaseAgent):
 
     name = "Planning Agent"
-    color = Agent.GREEN
+    color = BaseAgent.GREEN
     DEAL_THRESHOLD = 50
+    MAX_DEALS = 5
+    WORKERS = 5
+    MODES = ["sequential", "streaming", "pipeline"]
+    STAGE_WORKERS = {
+        "feed_poll": 4,
+        "detail_fetch": 8,
+        "selection": 1,
+        "rag_pricing": 2,
+        "specialist_pricing": 4,
+        "notification": 1,
+    }
+    STAGE_CAPACITY = 16
+    PRICING_TIMEOUT = 60
 
-    def __init__(self, collection):
+    def __init__(self, collection, mode: str = "sequential", stage_workers: Optional[Dict[str, int]] = None,
+                 concurrent_pricing: bool = False, cascade: bool = False):
         """
         Create instances of the 3 Agents that this planner coordinates across
+        :param mode: sequential runs each step in turn; streaming prices deals as the scanner streams them
+        and alerts on the first good one; pipeline runs the workflow on the staged runtime
+        :param stage_workers: overrides for the worker count of each pipeline stage
+        :param concurrent_pricing: price every deal with both estimators in parallel, rather than one at a time
+        :param cascade: price each deal with the cheapest estimator first, and only call the other
+        when the deal could be a bargain; the deals are still priced concurrently, as with concurrent_pricing
         """
         self.log("Planning Agent is initializing")
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown planning mode {mode}; expected one of {self.MODES}")
+        self.mode = mode
+        self.concurrent_pricing = concurrent_pricing
+        self.stage_workers = {**self.STAGE_WORKERS, **(stage_workers or {})}
+        self.pipeline = None
+        self.alerted = None
         self.scanner = ScannerAgent()
         self.frontier = FrontierAgent(collection)
         self.specialist = SpecialistAgent()
         self.messenger = MessagingAgent()
+        self.cascade = CascadeEstimator(["frontier", "specialist"], self.DEAL_THRESHOLD, log=self.log) if cascade else None
         self.log("Planning Agent is ready")
 
     def run(self, deal: Deal) -> Opportunity:
@@ -31,13 +63,113 @@ class PlanningAgent(BaseAgent):
         :returns: an opportunity including the discount
         """
         self.log("Planning Agent is pricing up a potential deal")
+        if self.cascade:
+            return self.run_cascade(deal)
         estimate1 = self.frontier.price(deal.product_description)
         estimate2 = self.specialist.price(deal.product_description)
-        estimate = (estimate1 + estimate2) / 2.0
+        return self.opportunity_for(deal, estimate1, estimate2)
+
+    def run_cascade(self, deal: Deal, neighbours: Optional[Tuple] = None) -> Opportunity:
+        """
+        Price this deal through the cascade, so a deal that's clearly not a bargain is priced by one estimator
+        The frontier's neighbours also give the product category, whose history the cascade consults
+        :param neighbours: the frontier's nearest neighbours for this deal, if already looked up
+        """
+        description = deal.product_description
+        neighbours = neighbours or self.frontier.neighbours_many([description])[0]
+        estimators = {
+            "frontier": lambda: self.frontier.price_neighbours(description, neighbours),
+            "specialist": lambda: self.specialist.price(description),
+        }
+        estimate = self.cascade.estimate(estimators, deal.price, self.frontier.category(neighbours))
+        return self.opportunity_at(deal, estimate)
+
+    def run_cascade_all(self, deals: List[Deal]) -> List[Opportunity]:
+        """
+        Run the cascade for every deal at once, so the specialist calls that are needed are micro-batched together
+        As in run_all, deals not priced within PRICING_TIMEOUT seconds, or whose pricing fails, are left out,
+        and if the batched retrieval fails each deal looks up its own neighbours
+        :returns: the opportunities, sorted with the biggest discount first
+        """
+        self.log(f"Planning Agent is pricing {len(deals)} deals through the cascade")
+        executor = ThreadPoolExecutor(max_workers=max(len(deals), 1))
+        opportunities = []
+        try:
+            deadline = time.monotonic() + self.PRICING_TIMEOUT
+            try:
+                retrieval = executor.submit(self.frontier.neighbours_many, [deal.product_description for deal in deals])
+                neighbours = retrieval.result(timeout=max(deadline - time.monotonic(), 0))
+            except Exception as e:
+                reason = "timed out" if isinstance(e, TimeoutError) else f"failed: {e}"
+                self.log(f"Planning Agent batched retrieval {reason}; each deal will look up its own")
+                neighbours = [None] * len(deals)
+            futures = [executor.submit(self.run_cascade, deal, found) for deal, found in zip(deals, neighbours)]
+            for deal, future in zip(deals, futures):
+                try:
+                    opportunities.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+                except TimeoutError:
+                    self.log(f"Planning Agent timed out pricing {deal.url}; skipping it")
+                except Exception as e:
+                    self.log(f"Planning Agent failed to price {deal.url}: {e}; skipping it")
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        opportunities.sort(key=lambda opp: opp.discount, reverse=True)
+        self.log(f"Planning Agent cascade stats: {self.cascade.stats()}")
+        return opportunities
+
+    def opportunity_for(self, deal: Deal, estimate1: float, estimate2: float) -> Opportunity:
+        """
+        Combine the two estimates for this deal into an Opportunity
+        """
+        return self.opportunity_at(deal, (estimate1 + estimate2) / 2.0)
+
+    def opportunity_at(self, deal: Deal, estimate: float) -> Opportunity:
         discount = estimate - deal.price
         self.log(f"Planning Agent has processed a deal with discount ${discount:.2f}")
         return Opportunity(deal=deal, estimate=estimate, discount=discount)
 
+    def run_all(self, deals: List[Deal]) -> List[Opportunity]:
+        """
+        Price every deal with both estimators at once, so the pricing phase takes about as long as its slowest call
+        The frontier retrieval for all the deals is batched into one embedding and one Chroma query
+        Deals that aren't fully priced within PRICING_TIMEOUT seconds, or whose pricing fails, are left out
+        If the batched retrieval fails or runs out of time, each deal is priced by the frontier on its own
+        :param deals: the deals to price
+        :returns: the opportunities, sorted with the biggest discount first
+        """
+        self.log(f"Planning Agent is pricing {len(deals)} deals concurrently")
+        executor = ThreadPoolExecutor(max_workers=max(2 * len(deals), 1))
+        opportunities = []
+        try:
+            deadline = time.monotonic() + self.PRICING_TIMEOUT
+            descriptions = [deal.product_description for deal in deals]
+            specialist_futures = [executor.submit(self.specialist.price, description) for description in descriptions]
+            try:
+                retrieval = executor.submit(self.frontier.neighbours_many, descriptions)
+                neighbours = retrieval.result(timeout=max(deadline - time.monotonic(), 0))
+                frontier_futures = [executor.submit(self.frontier.price_neighbours, description, found)
+                                    for description, found in zip(descriptions, neighbours)]
+            except Exception as e:
+                reason = "timed out" if isinstance(e, TimeoutError) else f"failed: {e}"
+                self.log(f"Planning Agent batched retrieval {reason}; pricing each deal separately")
+                frontier_futures = [executor.submit(self.frontier.price, description) for description in descriptions]
+            futures = zip(deals, frontier_futures, specialist_futures)
+            for deal, future1, future2 in futures:
+                try:
+                    estimate1 = future1.result(timeout=max(deadline - time.monotonic(), 0))
+                    estimate2 = future2.result(timeout=max(deadline - time.monotonic(), 0))
+                except TimeoutError:
+                    self.log(f"Planning Agent timed out pricing {deal.url}; skipping it")
+                    continue
+                except Exception as e:
+                    self.log(f"Planning Agent failed to price {deal.url}: {e}; skipping it")
+                    continue
+                opportunities.append(self.opportunity_for(deal, estimate1, estimate2))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        opportunities.sort(key=lambda opp: opp.discount, reverse=True)
+        return opportunities
+
     def plan(self, memory: List[str] = []) -> Optional[Opportunity]:
         """
         Run the full workflow:
@@ -49,15 +181,145 @@ class PlanningAgent(BaseAgent):
         :param memory: a list of URLs that have been surfaced in the past
         :return: an Opportunity if one was surfaced, otherwise None
         """
+        if self.mode == "streaming":
+            return self.plan_streaming(memory=memory)
+        if self.mode == "pipeline":
+            return self.plan_pipeline(memory=memory)
         self.log("Planning Agent is kicking off a run")
         selection = self.scanner.scan(memory=memory)
         if selection:
-            opportunities = [self.run(deal) for deal in selection.deals[:5]]
-            opportunities.sort(key=lambda opp: opp.discount, reverse=True)
+            deals = selection.deals[:self.MAX_DEALS]
+            if self.cascade:
+                opportunities = self.run_cascade_all(deals)
+            elif self.concurrent_pricing:
+                opportunities = self.run_all(deals)
+            else:
+                self.log(f"Planning Agent is pricing {len(deals)} deals")
+                descriptions = [deal.product_description for deal in deals]
+                estimates1 = self.frontier.price_many(descriptions)
+                estimates2 = self.specialist.price_many(descriptions)
+                opportunities = [self.opportunity_for(deal, estimate1, estimate2)
+                                 for deal, estimate1, estimate2 in zip(deals, estimates1, estimates2)]
+                opportunities.sort(key=lambda opp: opp.discount, reverse=True)
+            if not opportunities:
+                self.log("Planning Agent could not price any deals")
+                return None
             best = opportunities[0]
             self.log(f"Planning Agent has identified the best deal has discount ${best.discount:.2f}")
             if best.discount > self.DEAL_THRESHOLD:
                 self.messenger.alert(best)
             self.log("Planning Agent has completed a run")
             return best if best.discount > self.DEAL_THRESHOLD else None
-        return None
\ No newline at end of file
+        return None
+
+    def stream_opportunities(self, memory: List[str] = []) -> Iterator[Opportunity]:
+        """
+        Price each deal as soon as the scanner streams it, and yield opportunities as their pricing completes
+        Deals whose pricing fails are logged and skipped, as in run_all
+        :param memory: a list of URLs that have been surfaced in the past
+        """
+        executor = ThreadPoolExecutor(max_workers=self.WORKERS)
+        deals = {}
+
+        def completed(done) -> Iterator[Opportunity]:
+            for future in done:
+                deal = deals.pop(future)
+                try:
+                    yield future.result()
+                except Exception as e:
+                    self.log(f"Planning Agent failed to price {deal.url}: {e}; skipping it")
+
+        try:
+            for count, deal in enumerate(self.scanner.scan_stream(memory=memory), start=1):
+                deals[executor.submit(self.run, deal)] = deal
+                yield from completed([future for future in deals if future.done()])
+                if count >= self.MAX_DEALS:
+                    break
+            while deals:
+                done, _ = wait(list(deals), return_when=FIRST_COMPLETED)
+                yield from completed(done)
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def plan_streaming(self, memory: List[str] = []) -> Optional[Opportunity]:
+        """
+        Run the workflow as a stream: scrape -> select -> price -> notify
+        The first opportunity over the threshold is alerted straight away and the run ends there,
+        favouring time-to-first-alert over finding the single best deal
+        :param memory: a list of URLs that have been surfaced in the past
+        :return: an Opportunity if one was surfaced, otherwise None
+        """
+        self.log("Planning Agent is kicking off a streaming run")
+        best = None
+        for opportunity in self.stream_opportunities(memory=memory):
+            if opportunity.discount > self.DEAL_THRESHOLD:
+                self.log(f"Planning Agent found a deal with discount ${opportunity.discount:.2f}; alerting now")
+                self.messenger.alert(opportunity)
+                self.log("Planning Agent has completed a run")
+                return opportunity
+            if not best or opportunity.discount > best.discount:
+                best = opportunity
+        if best:
+            self.log(f"Planning Agent has identified the best deal has discount ${best.discount:.2f}")
+        self.log("Planning Agent has completed a run")
+        return None
+
+    def make_pipeline(self, memory: List[str]) -> Pipeline:
+        """
+        Build the staged runtime, with the existing agents as the workers of each stage:
+        feed poll -> detail fetch -> LLM selection -> RAG pricing -> specialist pricing -> notification
+        """
+        scanner = self.scanner
+        scanner.seen.add_all(opp.deal.url for opp in memory)
+
+        def poll(feed_url):
+            entries = scanner.cache.get(feed_url, feed_entries)
+            return [entry for entry in entries if ScrapedDeal.link(entry) not in scanner.seen]
+
+        def fetch(entry):
+            content = scanner.cache.get(ScrapedDeal.link(entry), ScrapedDeal.page_content)
+            return [ScrapedDeal(entry, content=content)]
+
+        def select(scraped):
+            selection = scanner.select(scraped)
+            return selection.deals[:self.MAX_DEALS] if selection else []
+
+        def rag_price(deal):
+            return [(deal, self.frontier.price(deal.product_description))]
+
+        def specialist_price(priced):
+            deal, estimate1 = priced
+            estimate2 = self.specialist.price(deal.product_description)
+            estimate = (estimate1 + estimate2) / 2.0
+            return [Opportunity(deal=deal, estimate=estimate, discount=estimate - deal.price)]
+
+        def notify(opportunity):
+            self.log(f"Planning Agent has processed a deal with discount ${opportunity.discount:.2f}")
+            if opportunity.discount > self.DEAL_THRESHOLD and not self.alerted:
+                self.messenger.alert(opportunity)
+                self.alerted = opportunity
+            return [opportunity]
+
+        handlers = [("feed_poll", poll), ("detail_fetch", fetch), ("selection", select),
+                    ("rag_pricing", rag_price), ("specialist_pricing", specialist_price), ("notification", notify)]
+        stages = [Stage(name, handler, workers=self.stage_workers[name], capacity=self.STAGE_CAPACITY,
+                        batch=(name == "selection")) for name, handler in handlers]
+        return Pipeline(stages, monitor_interval=5.0)
+
+    def plan_pipeline(self, memory: List[str] = []) -> Optional[Opportunity]:
+        """
+        Run the workflow on the staged runtime, where each stage has its own worker pool and bounded queue
+        so a slow Gemini call or Modal cold start only holds up its own stage
+        The first opportunity over the threshold is alerted as soon as it reaches the notification stage
+        :param memory: a list of URLs that have been surfaced in the past
+        :return: an Opportunity if one was surfaced, otherwise None
+        """
+        self.log("Planning Agent is kicking off a pipeline run")
+        self.alerted = None
+        self.pipeline = self.make_pipeline(memory)
+        opportunities = self.pipeline.run(feeds)
+        if opportunities:
+            best = max(opportunities, key=lambda opp: opp.discount)
+            self.log(f"Planning Agent has identified the best deal has discount ${best.discount:.2f}")
+        self.log("Planning Agent has completed a run")
+        return self.alerted
@@ -0,0 +1,61 @@
+import sqlite3
+import hashlib
+import threading
+from typing import Optional
+from items import Item
+from price_agents.llm_gateway import get_gateway
+
+PREPROCESS_MODEL = "llama3.2"
+
+
+def llm_preprocess(text: str, model: str = PREPROCESS_MODEL) -> str:
+    """
+    Ask local Ollama to rewrite this description more concisely
+    Not cached by the gateway: the Frontier Agent's PreprocessCache already keeps these rewrites
+    """
+    messages = [
+        {'role': 'user', 'content': f"Rewrite this more concisely: {text}"}
+    ]
+    return get_gateway().ollama_chat(messages, model=model).strip()
+
+
+def rules_preprocess(text: str) -> str:
+    """
+    Deterministic preprocessing with the same scrub rules used on the products in the vector store
+    """
+    return Item.scrub_text(text)
+
+
+class PreprocessCache:
+    """
+    A persistent SQLite cache of preprocessed descriptions, keyed by the model and a hash of the description
+    """
+
+    FILENAME = "preprocess_cache.db"
+
+    def __init__(self, filename: str = FILENAME):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS preprocessed (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[str]:
+        with self.lock:
+            row = self.connection.execute("SELECT result FROM preprocessed WHERE key = ?", (self.key(model, text),)).fetchone()
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, model: str, text: str, result: str) -> None:
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO preprocessed (key, result) VALUES (?, ?)",
+                                    (self.key(model, text), result))
+            self.connection.commit()
@@ -1,16 +1,102 @@
 # scanner_agent.py
 
 import os
-import json
-from typing import List, Optional
+import re
+from typing import Callable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 from agents import AsyncOpenAI, OpenAIChatCompletionsModel
 from agents.run import RunConfig
-from price_agents.deals import ScrapedDeal, DealSelection
+from price_agents.deals import ScrapedDeal, DealSelection, Deal
+from price_agents.json_stream import DealStream
 from price_agents.agent import Agent
-from openai import OpenAI
-import requests
+from price_agents.seen_urls import SeenUrls
+from price_agents.http_cache import HttpCache
+from price_agents.hedging import hedged, HedgeError
+from price_agents.llm_gateway import get_gateway
+
+class DealPrefilter:
+    """
+    A cheap, deterministic pass over scraped deals, making the same judgements we ask of the model:
+    every deal needs a clear price, "$XXX off" or "reduced by $XXX" is not a price,
+    and the deals with the most detailed descriptions are preferred
+    """
+
+    PRICE = re.compile(r"\$\s*(\d{1,3}(?:,\d{3})+|\d+)(\.\d{1,2})?")
+    DISCOUNT_AFTER = re.compile(r"\s*(?:off\b|discount\b|savings?\b|rebate\b|credit\b)", re.IGNORECASE)
+    DISCOUNT_BEFORE = re.compile(r"\b(?:reduced|marked down|cut|drops?|knocks?|save|saving|savings of|discount of|"
+                                 r"extra|additional|up to)\s*(?:by\s*)?(?:an?\s*)?(?:extra\s*)?$", re.IGNORECASE)
+    SENTENCE = re.compile(r"(?<=[.!?])\s+")
+    RICHNESS_CAP = 3000
+    DISCOUNT_PENALTY = 0.8
+
+    def prices(self, text: str) -> Tuple[List[float], bool]:
+        """
+        Find the dollar amounts in this text that are prices rather than discounts
+        :return: the prices, and whether the text also mentions a discount amount
+        """
+        prices, discounted = [], False
+        for match in self.PRICE.finditer(text):
+            if self.DISCOUNT_AFTER.match(text, match.end()) or self.DISCOUNT_BEFORE.search(text[:match.start()]):
+                discounted = True
+                continue
+            prices.append(float(match.group(1).replace(",", "") + (match.group(2) or "")))
+        return prices, discounted
+
+    def price(self, scraped: ScrapedDeal) -> Tuple[Optional[float], bool]:
+        """
+        The deal's price: the first in its title, otherwise the first in its summary
+        :return: the price (None if there's no clear price) and whether discount phrasing was seen
+        """
+        discounted = False
+        for text in (scraped.title, scraped.summary):
+            prices, discount = self.prices(text)
+            discounted = discounted or discount
+            prices = [p for p in prices if p > 0]
+            if prices:
+                return prices[0], discounted
+        return None, discounted
+
+    def richness(self, scraped: ScrapedDeal) -> float:
+        """
+        How detailed the deal's description is, from 0 to 1, by the length of its details and features
+        """
+        return min(len(scraped.details.strip()) + len(scraped.features.strip()), self.RICHNESS_CAP) / self.RICHNESS_CAP
+
+    def score(self, scraped: ScrapedDeal) -> Optional[float]:
+        """
+        The deal's richness, discounted when it also talks about money off; None if it has no clear price
+        """
+        price, discounted = self.price(scraped)
+        if price is None:
+            return None
+        return self.richness(scraped) * (self.DISCOUNT_PENALTY if discounted else 1.0)
+
+    def rank(self, scraped: List[ScrapedDeal], top_n: Optional[int] = None) -> List[ScrapedDeal]:
+        """
+        Drop the deals without a clear price, and return the rest best first, keeping at most top_n
+        """
+        scored = [(score, deal) for deal in scraped if (score := self.score(deal)) is not None]
+        scored.sort(key=lambda pair: pair[0], reverse=True)
+        ranked = [deal for _, deal in scored]
+        return ranked[:top_n] if top_n else ranked
+
+    def describe(self, scraped: ScrapedDeal, sentences: int = 4) -> str:
+        """
+        A product description made from the deal's title and the first few sentences of its details
+        """
+        details = " ".join(self.SENTENCE.split(" ".join(scraped.details.split()))[:sentences])
+        return f"{scraped.title}. {details}".strip()
+
+    def select(self, scraped: List[ScrapedDeal], count: int) -> DealSelection:
+        """
+        Select the best deals without a model
+        """
+        deals = [Deal(product_description=self.describe(s), price=self.price(s)[0], url=s.url)
+                 for s in self.rank(scraped, count)]
+        return DealSelection(deals=deals)
+
 
 class ScannerAgent(Agent):
 
@@ -50,6 +136,15 @@ Deals:
 
     name = "Scanner Agent"
     color = Agent.CYAN
+    CONCURRENT_FETCH = True
+    HEDGE_DELAY = None    # opt in with a delay near Gemini's measured p95 latency, e.g. 10.0
+    SHARD_SIZE = 20
+    SHARD_WORKERS = 4
+    SELECT_COUNT = 5
+    MERGE = "llm"
+    PREFILTER = False    # opt in to drop deals without a clear price before the model sees them
+    PREFILTER_TOP_N = 3 * SHARD_SIZE
+    LLM_FREE = False
 
     def __init__(self):
         self.MODEL = "gemini-2.5-flash-lite"
@@ -59,31 +154,34 @@ Deals:
         if not gemini_api_key:
             raise RuntimeError("GEMINI_API_KEY missing in .env")
 
-        # Create an OpenAI-compatible client that points at the Gemini endpoint:
-        self.openai = OpenAI(
-            api_key=gemini_api_key,
-            base_url="https://generativelanguage.googleapis.com/v1beta/openai/"
-        )
+        # All LLM calls go through the shared gateway; the Agents SDK wrapper gets its pooled async client
+        self.gateway = get_gateway()
         # Wrap it in the OpenAIChatCompletionsModel for convenience:
         self.model = OpenAIChatCompletionsModel(
             model=self.MODEL,
-            openai_client=self.openai
+            openai_client=self.gateway.gemini_async
         )
         # (we won't need Runner here, but if you did:)
         self.run_config = RunConfig(
             model=self.model,
-            model_provider=self.openai,
+            model_provider=self.gateway.gemini_async,
             tracing_disabled=True
         )
 
+        self.seen = SeenUrls()
+        self.cache = HttpCache()
+        self.prefilter = DealPrefilter()
         self.log("Scanner Agent is ready with Gemini Flash")
 
     def fetch_deals(self, memory) -> List[ScrapedDeal]:
+        """
+        Fetch deals from the RSS feeds, skipping any we've seen before
+        Deals are filtered by link before their detail pages are downloaded
+        """
         self.log("Scanner Agent is about to fetch deals from RSS feed")
-        urls = [opp.deal.url for opp in memory]
-        scraped = ScrapedDeal.fetch()
-        new = [scr for scr in scraped if scr.url not in urls]
-        self.log(f"Scanner Agent received {len(new)} new deals")
+        self.seen.add_all(opp.deal.url for opp in memory)
+        new = ScrapedDeal.fetch(concurrent=self.CONCURRENT_FETCH, skip=self.seen.__contains__, cache=self.cache)
+        self.log(f"Scanner Agent received {len(new)} new deals; HTTP cache stats {self.cache.stats()}")
         return new
 
     def make_user_prompt(self, scraped: List[ScrapedDeal]) -> str:
@@ -92,69 +190,208 @@ Deals:
         prompt += self.USER_PROMPT_SUFFIX
         return prompt
 
+    def make_merge_prompt(self, deals: List[Deal]) -> str:
+        """
+        A prompt to choose between deals already selected from different shards
+        """
+        prompt = self.USER_PROMPT_PREFIX
+        prompt += "\n\n".join(f"Description: {d.product_description}\nPrice: ${d.price:.2f}\nURL: {d.url}" for d in deals)
+        prompt += self.USER_PROMPT_SUFFIX
+        return prompt
+
 
     def scan(self, memory: List[str] = []) -> Optional[DealSelection]:
         scraped = self.fetch_deals(memory)
         if not scraped:
             return None
+        return self.select(scraped)
+
+    def candidates(self, scraped: List[ScrapedDeal]) -> List[ScrapedDeal]:
+        """
+        The deals to offer for selection: all of them, or with PREFILTER set,
+        only the PREFILTER_TOP_N richest of those with a clear price
+        """
+        if not self.PREFILTER:
+            return scraped
+        candidates = self.prefilter.rank(scraped, self.PREFILTER_TOP_N)
+        self.log(f"Scanner Agent prefilter kept {len(candidates)} of {len(scraped)} deals")
+        return candidates
+
+    def select(self, scraped: List[ScrapedDeal]) -> Optional[DealSelection]:
+        """
+        Ask the model to pick the most promising deals from those scraped
+        With PREFILTER set, the rule-based prefilter first drops deals without a clear price;
+        with LLM_FREE set, its ranking makes the selection and no model is called
+        More than SHARD_SIZE deals are selected map-reduce style, so that no single call grows with the feeds
+        Only the selected deals are recorded as seen; deals passed over here are offered again next run
+        """
+        candidates = self.candidates(scraped)
+        if not candidates:
+            result = None
+        elif self.LLM_FREE:
+            result = self.prefilter.select(candidates, self.SELECT_COUNT)
+        elif len(candidates) > self.SHARD_SIZE:
+            result = self.select_sharded(candidates)
+        else:
+            result = self.select_once(self.make_user_prompt(candidates))
+        if result:
+            self.seen.add_all(deal.url for deal in result.deals)
+        return result
+
+    def select_shards(self, items: List, make_prompt: Callable[[List], str]) -> List[Deal]:
+        """
+        Split items into shards of SHARD_SIZE, and run a selection on each shard concurrently
+        :return: the deals selected from every shard, at most SELECT_COUNT from each
+        """
+        shards = [items[i:i + self.SHARD_SIZE] for i in range(0, len(items), self.SHARD_SIZE)]
+        self.log(f"Scanner Agent is selecting from {len(items)} items in {len(shards)} shards")
+        with ThreadPoolExecutor(max_workers=self.SHARD_WORKERS) as executor:
+            selections = list(executor.map(lambda shard: self.select_once(make_prompt(shard)), shards))
+        return [deal for selection in selections if selection for deal in selection.deals[:self.SELECT_COUNT]]
+
+    def select_sharded(self, scraped: List[ScrapedDeal]) -> Optional[DealSelection]:
+        """
+        Map: select the best deals from each shard of the scraped deals
+        Reduce: pick the overall top SELECT_COUNT from the shards' picks, with further LLM rounds
+        (themselves sharded while there are too many picks for one call) or, with MERGE = "score",
+        by ranking on how detailed each deal's scraped description is
+        """
+        candidates = self.select_shards(scraped, self.make_user_prompt)
+        if not candidates:
+            return None
+        if self.MERGE == "llm":
+            while len(candidates) > self.SHARD_SIZE:
+                candidates = self.select_shards(candidates, self.make_merge_prompt)
+            if not candidates:
+                return None
+            if len(candidates) > self.SELECT_COUNT:
+                merged = self.select_once(self.make_merge_prompt(candidates))
+                if merged and merged.deals:
+                    return merged
+                self.log("Scanner Agent merge round failed; ranking the shard selections instead")
+        richness = {s.url: self.prefilter.richness(s) for s in scraped}
+        ranked = sorted(candidates, key=lambda deal: richness.get(deal.url, 0), reverse=True)
+        return DealSelection(deals=ranked[:self.SELECT_COUNT])
 
-        user_prompt = self.make_user_prompt(scraped)
+    def select_once(self, user_prompt: str) -> Optional[DealSelection]:
+        """
+        Make a single selection call with this prompt
+        With HEDGE_DELAY set, local Ollama is asked too if Gemini hasn't answered within that many seconds,
+        and the first non-empty reply is used; by default Ollama is only asked after Gemini fails
+        """
         self.log("Scanner Agent is calling Gemini Flash")
         self.log("=== USER GEMINI REQUEST BEGIN ===\n" + user_prompt + "\n=== USER GEMINI REQUEST END ===")
 
-        try:
-            response = self.openai.chat.completions.create(
-                model=self.MODEL,
-                messages=[
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user",   "content": user_prompt},
-                ],
-                max_tokens=1000
-            )
-            raw = response.choices[0].message.content
-        except Exception as e:
-            self.log(f"❌ Gemini failed: {e}. Falling back to local Ollama.")
-            # Send to Ollama instead:
-            ollama_url = "http://127.0.0.1:11436/api/chat"
-            ollama_model = "llama3.2"  # Or your preferred Ollama model
-            ollama_payload = {
-                "model": ollama_model,
-                "messages": [
-                    {"role": "system", "content": self.SYSTEM_PROMPT},
-                    {"role": "user", "content": user_prompt}
-                ]
-            }
+        if self.HEDGE_DELAY is not None:
             try:
-                ollama_resp = requests.post(ollama_url, json=ollama_payload)
-                ollama_resp.raise_for_status()
-                # You may need to adjust this based on Ollama's chat output structure:
-                ollama_json = ollama_resp.json()
-                raw = ollama_json.get("message", {}).get("content", "")
-            except Exception as ollama_e:
-                self.log(f"❌ Ollama fallback also failed: {ollama_e}")
+                raw = hedged(lambda: self.complete_gemini(user_prompt), lambda: self.complete_ollama(user_prompt),
+                             self.HEDGE_DELAY, valid=lambda reply: bool(reply and reply.strip()), log=self.log)
+            except HedgeError as e:
+                self.log(f"❌ {e}")
                 return None
-
-        # Unwrap markdown (same as before)
-        if raw.strip().startswith("```"):
-            lines = raw.strip().splitlines()
-            if lines[0].startswith("```"):
-                lines = lines[1:]
-            if lines and lines[-1].startswith("```"):
-                lines = lines[:-1]
-            raw = "\n".join(lines)
+        else:
+            try:
+                raw = self.complete_gemini(user_prompt)
+            except Exception as e:
+                self.log(f"❌ Gemini failed: {e}. Falling back to local Ollama.")
+                try:
+                    raw = self.complete_ollama(user_prompt)
+                except Exception as ollama_e:
+                    self.log(f"❌ Ollama fallback also failed: {ollama_e}")
+                    return None
 
         self.log("=== RAW RESPONSE BEGIN ===\n" + raw + "\n=== RAW RESPONSE END ===")
+        stream = DealStream()
+        deals = stream.feed(raw) + stream.finish()
+        if stream.rejected:
+            self.log(f"❌ Skipped {stream.rejected} malformed deals in the response")
+        if not deals:
+            self.log("❌ Failed to parse any deals from the response")
+            return None
+        result = DealSelection(deals=[d for d in deals if d.price > 0])
+        self.log(f"Scanner Agent selected {len(result.deals)} deals with price>0")
+        return result
+
+    def complete_gemini(self, user_prompt: str) -> str:
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user",   "content": user_prompt},
+        ]
+        return self.gateway.gemini_chat(self.MODEL, messages, use_cache=False, max_tokens=1000)
+
+    def complete_ollama(self, user_prompt: str) -> str:
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user", "content": user_prompt}
+        ]
+        return self.gateway.ollama_chat(messages, use_cache=False)
+
+    def stream_completion(self, user_prompt: str) -> Iterator[str]:
+        """
+        Stream the selection response from Gemini, falling back to local Ollama if Gemini fails before answering
+        """
+        messages = [
+            {"role": "system", "content": self.SYSTEM_PROMPT},
+            {"role": "user",   "content": user_prompt},
+        ]
+        answered = False
         try:
-            parsed = json.loads(raw.strip())
-            result = DealSelection(**parsed)
-            result.deals = [d for d in result.deals if d.price > 0]
-            self.log(f"Scanner Agent selected {len(result.deals)} deals with price>0")
-            return result
+            for content in self.gateway.gemini_stream(self.MODEL, messages, max_tokens=1000):
+                answered = True
+                yield content
+            return
         except Exception as e:
-            self.log(f"❌ Failed to parse response: {e}")
-            return None
+            if answered:
+                self.log(f"❌ Gemini stream failed part way: {e}")
+                return
+            self.log(f"❌ Gemini failed: {e}. Falling back to local Ollama.")
+        try:
+            yield from self.gateway.ollama_stream(messages)
+        except Exception as ollama_e:
+            self.log(f"❌ Ollama fallback also failed: {ollama_e}")
+
+    def scan_stream(self, memory: List[str] = []) -> Iterator[Deal]:
+        """
+        Like scan, but stream the model's response and yield each Deal as soon as its JSON object is complete,
+        so that pricing can start before the model has finished selecting
+        More than SHARD_SIZE candidates are selected map-reduce style as in select, and yielded once merged
+        """
+        scraped = self.fetch_deals(memory)
+        candidates = self.candidates(scraped)
+        if not candidates:
+            return
+        if len(candidates) > self.SHARD_SIZE and not self.LLM_FREE:
+            result = self.select_sharded(candidates)
+            if result:
+                self.seen.add_all(deal.url for deal in result.deals)
+                yield from result.deals
+            return
+        if self.LLM_FREE:
+            selection = self.prefilter.select(candidates, self.SELECT_COUNT)
+            self.seen.add_all(deal.url for deal in selection.deals)
+            yield from selection.deals
+            return
+        user_prompt = self.make_user_prompt(candidates)
+        self.log("Scanner Agent is streaming from Gemini Flash")
+        stream = DealStream()
+        selected = []
 
+        def batches() -> Iterator[List[Deal]]:
+            for chunk in self.stream_completion(user_prompt):
+                yield stream.feed(chunk)
+            yield stream.finish()
 
+        for deals in batches():
+            for deal in deals:
+                if deal.price > 0:
+                    # Recorded before yielding, as the consumer may stop early and never resume this generator
+                    self.seen.add_all([deal.url])
+                    selected.append(deal.url)
+                    self.log(f"Scanner Agent streamed deal {len(selected)}: {deal.product_description[:60]}...")
+                    yield deal
+        if stream.rejected:
+            self.log(f"❌ Skipped {stream.rejected} malformed deals in the stream")
+        self.log(f"Scanner Agent streamed {len(selected)} deals with price>0")
 
     def test_scan(self, memory: List[str] = []) -> Optional[DealSelection]:
         # a stub for local testing if you need it
@@ -0,0 +1,107 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlparse
+import httpx
+from price_agents.http_cache import HttpCache
+
+MAX_CONCURRENCY = 16
+PER_HOST_CONCURRENCY = 4
+PER_HOST_INTERVAL = 0.05
+TIMEOUT = 20.0
+
+
+def run_sync(coro):
+    """
+    Run a coroutine to completion from synchronous code
+    If we're already inside an event loop (eg the Agents SDK or Jupyter), run it on a separate thread
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+class HostLimiter:
+    """
+    Politeness limit for a single host: caps the requests in flight,
+    and spaces out the start of each request by a minimum interval
+    """
+
+    def __init__(self, concurrency: int, interval: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.interval = interval
+        self.last_start = 0.0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        async with self.lock:
+            wait = self.last_start + self.interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_start = time.monotonic()
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class AsyncScraper:
+    """
+    Fetches feeds and pages concurrently over a single pooled keep-alive HTTP client
+    A global semaphore caps the total requests in flight, and each host gets its own HostLimiter
+    Use as an async context manager so that the connection pool is closed afterwards
+    With an HttpCache, requests are made conditionally and unchanged responses aren't re-parsed
+    """
+
+    def __init__(self, max_concurrency: int = MAX_CONCURRENCY, per_host_concurrency: int = PER_HOST_CONCURRENCY,
+                 per_host_interval: float = PER_HOST_INTERVAL, timeout: float = TIMEOUT,
+                 cache: Optional[HttpCache] = None):
+        self.cache = cache
+        self.max_concurrency = max_concurrency
+        self.per_host_concurrency = per_host_concurrency
+        self.per_host_interval = per_host_interval
+        self.timeout = timeout
+        self.client = None
+        self.semaphore = None
+        self.hosts: Dict[str, HostLimiter] = {}
+
+    async def __aenter__(self):
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        self.client = httpx.AsyncClient(limits=limits, timeout=self.timeout, follow_redirects=True)
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.client.aclose()
+
+    def limiter_for(self, url: str) -> HostLimiter:
+        host = urlparse(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimiter(self.per_host_concurrency, self.per_host_interval)
+        return self.hosts[host]
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        """
+        Make a GET request for this url, respecting the global and per-host limits
+        """
+        async with self.semaphore, self.limiter_for(url):
+            response = await self.client.get(url, headers=headers)
+        if response.status_code != 304:
+            response.raise_for_status()
+        return response
+
+    async def get_parsed(self, url: str, parse: Callable[[bytes], Any]) -> Any:
+        """
+        Retrieve this url and return the parsed body, going through the cache if we have one
+        """
+        if not self.cache:
+            response = await self.get(url)
+            return parse(response.content)
+        response = await self.get(url, headers=self.cache.headers(url))
+        if self.cache.needs_refetch(url, response.status_code):
+            response = await self.get(url)
+        return self.cache.resolve(url, response.status_code, response.headers, response.content, parse)
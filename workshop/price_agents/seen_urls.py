@@ -0,0 +1,50 @@
+import os
+import hashlib
+from typing import Iterable
+
+
+class SeenUrls:
+    """
+    A persistent index of URLs we've already seen, stored as fixed-size hashes
+    The Scanner records the deals it selected and those surfaced in memory, so a deal it passed over is offered again
+    The file is append-only: each new URL adds one 16 byte digest to the end
+    Membership tests are constant time against an in-memory set of digests
+    """
+
+    FILENAME = "seen_urls.idx"
+    DIGEST_SIZE = 16
+
+    def __init__(self, filename: str = FILENAME):
+        self.filename = filename
+        self.digests = set()
+        if os.path.exists(filename):
+            with open(filename, "rb") as file:
+                data = file.read()
+            size = self.DIGEST_SIZE
+            self.digests = {data[i:i + size] for i in range(0, len(data) - size + 1, size)}
+
+    @classmethod
+    def digest(cls, url: str) -> bytes:
+        return hashlib.blake2b(url.strip().encode("utf-8"), digest_size=cls.DIGEST_SIZE).digest()
+
+    def __contains__(self, url: str) -> bool:
+        return self.digest(url) in self.digests
+
+    def __len__(self) -> int:
+        return len(self.digests)
+
+    def add_all(self, urls: Iterable[str]) -> int:
+        """
+        Record these urls as seen, persisting any that are new
+        :return: the number of urls that weren't already in the index
+        """
+        new = []
+        for url in urls:
+            digest = self.digest(url)
+            if digest not in self.digests:
+                self.digests.add(digest)
+                new.append(digest)
+        if new:
+            with open(self.filename, "ab") as file:
+                file.write(b"".join(new))
+        return len(new)
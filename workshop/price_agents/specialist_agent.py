@@ -1,29 +1,51 @@
-import modal
+import os
+from typing import List, Optional
 from price_agents.agent import Agent
+from price_agents.batching import MicroBatcher
+from price_agents.specialist_backends import make_backend
 
 
 class SpecialistAgent(Agent):
     """
-    An Agent that runs our fine-tuned LLM that's running remotely on Modal
+    An Agent that runs our fine-tuned LLM, remotely on Modal, in this process, or behind a local HTTP server
+    Concurrent calls to price are micro-batched into single price_batch calls
     """
 
     name = "Specialist Agent"
     color = Agent.RED
 
-    def __init__(self):
+    BATCH_WINDOW = 0.05
+    MAX_BATCH = 16
+
+    def __init__(self, backend: Optional[str] = None):
         """
-        Set up this Agent by creating an instance of the modal class
+        Set up this Agent by connecting to the model
+        :param backend: "modal", "local" or "http"; by default from SPECIALIST_BACKEND, or modal
         """
-        self.log("Specialist Agent is initializing - connecting to modal")
-        Pricer = modal.Cls.from_name("pricer-service", "Pricer")
-        self.pricer = Pricer()
+        backend = backend or os.getenv("SPECIALIST_BACKEND", "modal")
+        self.log(f"Specialist Agent is initializing - connecting to {backend}")
+        self.backend = make_backend(backend)
+        self.batcher = MicroBatcher(self.price_batch, window=self.BATCH_WINDOW, max_batch=self.MAX_BATCH)
         self.log("Specialist Agent is ready")
-        
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        self.log(f"Specialist Agent is calling fine-tuned model with a batch of {len(descriptions)}")
+        return self.backend.price_batch(descriptions)
+
     def price(self, description: str) -> float:
         """
-        Make a remote call to return the estimate of the price of this item
+        Return the model's estimate of the price of this item, batched with any concurrent calls
         """
-        self.log("Specialist Agent is calling remote fine-tuned model")
-        result = self.pricer.price.remote(description)
+        result = self.batcher.submit(description)
         self.log(f"Specialist Agent completed - predicting ${result:.2f}")
         return result
+
+    def price_many(self, descriptions: List[str]) -> List[float]:
+        """
+        Price these items with one call
+        """
+        if not descriptions:
+            return []
+        results = self.price_batch(descriptions)
+        self.log(f"Specialist Agent completed - predicting {', '.join(f'${r:.2f}' for r in results)}")
+        return results
@@ -0,0 +1,81 @@
+import os
+import threading
+from typing import List
+import requests
+
+BACKENDS = ["modal", "local", "http"]
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+class ModalBackend:
+    """
+    The Pricer deployed on Modal, called remotely
+    """
+
+    def __init__(self):
+        import modal
+        Pricer = modal.Cls.from_name("pricer-service", "Pricer")
+        self.pricer = Pricer()
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        return self.pricer.price_batch.remote(descriptions)
+
+    def wake_up(self) -> str:
+        return self.pricer.wake_up.remote()
+
+
+class LocalBackend:
+    """
+    The same pricing model as the Modal Pricer, loaded into this process from locally baked weights
+    Calls are serialized, since one generate already uses all the CPU's threads
+    """
+
+    def __init__(self, weights: str = "weights", variant: str = None):
+        from pricer_model import PricerCore
+        self.core = PricerCore.from_baked(weights, variant)
+        self.lock = threading.Lock()
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        with self.lock:
+            return self.core.price_batch(descriptions)
+
+    def wake_up(self) -> str:
+        return "ok"
+
+
+class HttpBackend:
+    """
+    A pricer_server.py running nearby, called over keep-alive HTTP
+    """
+
+    TIMEOUT = 60
+
+    def __init__(self, url: str = DEFAULT_URL):
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        response = self.session.post(f"{self.url}/price_batch", json={"descriptions": descriptions},
+                                     timeout=self.TIMEOUT)
+        response.raise_for_status()
+        return response.json()["prices"]
+
+    def wake_up(self) -> str:
+        response = self.session.get(f"{self.url}/health", timeout=self.TIMEOUT)
+        response.raise_for_status()
+        return response.json()["status"]
+
+
+def make_backend(name: str = None):
+    """
+    Create the specialist backend named here, or by SPECIALIST_BACKEND, defaulting to modal
+    The http backend's address comes from SPECIALIST_URL
+    """
+    name = name or os.getenv("SPECIALIST_BACKEND", "modal")
+    if name == "modal":
+        return ModalBackend()
+    if name == "local":
+        return LocalBackend()
+    if name == "http":
+        return HttpBackend(os.getenv("SPECIALIST_URL", DEFAULT_URL))
+    raise ValueError(f"Unknown specialist backend {name}; expected one of {BACKENDS}")
@@ -0,0 +1,319 @@
+import os
+import json
+import mmap
+import hashlib
+import importlib.util
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+Neighbours = Tuple[List[str], List[Dict], List[float]]
+
+
+class ChromaRetriever:
+    """
+    Nearest neighbour lookups against the Chroma collection
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, vectors: np.ndarray, n_results: int = 5) -> List[Neighbours]:
+        """
+        Return the documents, metadata and distances of the nearest products for each vector
+        """
+        results = self.collection.query(
+            query_embeddings=np.asarray(vectors).astype(float).tolist(),
+            n_results=n_results
+        )
+        return list(zip(results['documents'], results['metadatas'], results['distances']))
+
+
+class ProductIndex:
+    """
+    An in-process approximate nearest neighbour index over the products collection
+    Embeddings live in a memory-mapped float32 matrix, so only the rows we touch are paged in,
+    and documents are read lazily from a line-per-product file using a table of byte offsets
+    Search uses HNSW if hnswlib is installed and method="hnsw", otherwise an IVF index built with numpy:
+    k-means centroids, with the rows of each cluster stored contiguously so a probe reads one slice
+    Distances are squared L2, the same as the Chroma collection
+
+    For IVF, the vectors that are scanned can be held in a compact form, chosen by precision when building:
+    float16 (embeddings.f16.npy), or int8 with a float32 scale per vector (embeddings.i8.npy and scales.npy)
+    The compact vectors are loaded into memory, while the float32 matrix stays on disk and is only read
+    for an optional exact re-rank of the best rerank candidates
+    """
+
+    DIRECTORY = "products_index"
+    BATCH = 5000
+    TRAINING_SAMPLE = 50000
+    ITERATIONS = 12
+    MARKER_ROWS = 100
+    PRECISIONS = ["float32", "float16", "int8"]
+
+    def __init__(self, directory: str = DIRECTORY, nprobe: int = 8, ef: int = 64, rerank: int = 0):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.ef = ef
+        self.rerank = rerank
+        with open(self.path("manifest.json"), "r") as file:
+            self.manifest = json.load(file)
+        self.count = self.manifest["count"]
+        self.dim = self.manifest["dim"]
+        self.method = self.manifest["method"]
+        self.precision = self.manifest.get("precision", "float32")
+        self.embeddings = np.memmap(self.path("embeddings.f32"), dtype=np.float32, mode="r", shape=(self.count, self.dim))
+        if self.precision == "float16":
+            self.compact = np.load(self.path("embeddings.f16.npy"))
+        elif self.precision == "int8":
+            self.compact = np.load(self.path("embeddings.i8.npy"))
+            self.scales = np.load(self.path("scales.npy"))
+        self.prices = np.load(self.path("prices.npy"))
+        self.offsets = np.load(self.path("offsets.npy"))
+        self.records_file = open(self.path("records.jsonl"), "rb")
+        self.records = mmap.mmap(self.records_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.method == "hnsw":
+            import hnswlib
+            self.hnsw = hnswlib.Index(space="l2", dim=self.dim)
+            self.hnsw.load_index(self.path("hnsw.bin"), max_elements=self.count)
+            self.hnsw.set_ef(max(ef, 5))
+        else:
+            self.centroids = np.load(self.path("centroids.npy"))
+            self.list_offsets = np.load(self.path("list_offsets.npy"))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    @classmethod
+    def build(cls, collection, directory: str = DIRECTORY, method: str = "ivf", nlist: Optional[int] = None,
+              precision: str = "float32") -> None:
+        """
+        Export the collection's embeddings, prices and documents, and build the ANN index over them
+        For IVF, the exported rows are reordered so that each cluster's rows are contiguous
+        """
+        if method == "hnsw" and not importlib.util.find_spec("hnswlib"):
+            raise ValueError("hnswlib is not installed; use method='ivf'")
+        if precision not in cls.PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}; expected one of {cls.PRECISIONS}")
+        os.makedirs(directory, exist_ok=True)
+        count = collection.count()
+        ids, documents, metadatas, chunks = [], [], [], []
+        for offset in range(0, count, cls.BATCH):
+            result = collection.get(include=['embeddings', 'documents', 'metadatas'], limit=cls.BATCH, offset=offset)
+            ids += result['ids']
+            documents += result['documents']
+            metadatas += result['metadatas']
+            chunks.append(np.asarray(result['embeddings'], dtype=np.float32))
+        if not chunks or not ids:
+            raise ValueError("The collection is empty; there is nothing to index")
+        vectors = np.concatenate(chunks)
+        count, dim = vectors.shape
+        marked = [i for start in cls.marker_offsets(count) for i in range(start, min(start + cls.MARKER_ROWS, count))]
+        manifest = {"count": count, "dim": dim, "method": method, "precision": precision,
+                    "fingerprint": cls.digest(ids, documents, metadatas),
+                    "marker": cls.digest([ids[i] for i in marked], [documents[i] for i in marked],
+                                         [metadatas[i] for i in marked])}
+
+        if method == "hnsw":
+            import hnswlib
+            order = np.arange(count)
+            index = hnswlib.Index(space="l2", dim=dim)
+            index.init_index(max_elements=count, ef_construction=200, M=16)
+            index.add_items(vectors, order)
+            index.save_index(os.path.join(directory, "hnsw.bin"))
+        else:
+            nlist = nlist or max(1, min(int(4 * np.sqrt(count)), 4096, count))
+            centroids = cls.kmeans(vectors, nlist)
+            assignments = cls.assign(vectors, centroids)
+            order = np.argsort(assignments, kind="stable")
+            list_offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+            np.save(os.path.join(directory, "centroids.npy"), centroids)
+            np.save(os.path.join(directory, "list_offsets.npy"), list_offsets)
+            manifest["nlist"] = nlist
+
+        matrix = np.memmap(os.path.join(directory, "embeddings.f32"), dtype=np.float32, mode="w+", shape=(count, dim))
+        matrix[:] = vectors[order]
+        matrix.flush()
+        if precision == "float16":
+            np.save(os.path.join(directory, "embeddings.f16.npy"), vectors[order].astype(np.float16))
+        elif precision == "int8":
+            codes, scales = cls.quantize(vectors[order])
+            np.save(os.path.join(directory, "embeddings.i8.npy"), codes)
+            np.save(os.path.join(directory, "scales.npy"), scales)
+        np.save(os.path.join(directory, "prices.npy"), np.array([metadatas[i]['price'] for i in order], dtype=np.float32))
+        offsets = []
+        with open(os.path.join(directory, "records.jsonl"), "wb") as file:
+            for i in order:
+                offsets.append(file.tell())
+                record = {"id": ids[i], "document": documents[i], "metadata": metadatas[i]}
+                file.write(json.dumps(record).encode("utf-8") + b"\n")
+            offsets.append(file.tell())
+        np.save(os.path.join(directory, "offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(directory, "manifest.json"), "w") as file:
+            json.dump(manifest, file)
+
+    @staticmethod
+    def digest(ids: List[str], documents: List[str], metadatas: List[Dict]) -> str:
+        """
+        A hash of every product's id, document and metadata, independent of the order they're listed in
+        """
+        rows = sorted(zip(ids, documents, metadatas), key=lambda row: row[0])
+        hasher = hashlib.blake2b(digest_size=16)
+        for row in rows:
+            hasher.update(json.dumps(row, sort_keys=True).encode("utf-8") + b"\n")
+        return hasher.hexdigest()
+
+    @classmethod
+    def marker_offsets(cls, count: int) -> List[int]:
+        return sorted({0, max(0, count - cls.MARKER_ROWS)})
+
+    @classmethod
+    def marker(cls, collection) -> str:
+        """
+        A cheap check on the collection's contents: the digest of its first and last MARKER_ROWS products
+        """
+        ids, documents, metadatas = [], [], []
+        for offset in cls.marker_offsets(collection.count()):
+            result = collection.get(include=['documents', 'metadatas'], limit=cls.MARKER_ROWS, offset=offset)
+            ids += result['ids']
+            documents += result['documents']
+            metadatas += result['metadatas']
+        return cls.digest(ids, documents, metadatas)
+
+    @classmethod
+    def load_or_build(cls, collection, directory: str = DIRECTORY, method: str = "ivf", precision: str = "float32",
+                      rebuild: bool = False, **kwargs) -> "ProductIndex":
+        """
+        Load the index, first rebuilding it from the collection if it's missing or out of date
+        It's out of date if the build settings differ, or the collection's product count or marker changed;
+        that doesn't catch every edit in the middle of the collection, so pass rebuild=True after re-pricing
+        :param rebuild: rebuild unconditionally, which also records a fingerprint of every product in the manifest
+        """
+        manifest_path = os.path.join(directory, "manifest.json")
+        stale = True
+        if os.path.exists(manifest_path) and not rebuild:
+            with open(manifest_path, "r") as file:
+                manifest = json.load(file)
+            stale = (manifest["count"] != collection.count() or manifest["method"] != method
+                     or manifest.get("precision", "float32") != precision
+                     or manifest.get("marker") != cls.marker(collection))
+        if stale:
+            cls.build(collection, directory, method=method, precision=precision)
+        return cls(directory, **kwargs)
+
+    @staticmethod
+    def quantize(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Symmetric int8 quantization with one scale per vector
+        """
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def vectors_for(self, rows: np.ndarray) -> np.ndarray:
+        """
+        The vectors for these rows at the index's precision, as float32 for scoring
+        """
+        if self.precision == "float16":
+            return self.compact[rows].astype(np.float32)
+        if self.precision == "int8":
+            return self.compact[rows].astype(np.float32) * self.scales[rows, None]
+        return np.asarray(self.embeddings[rows])
+
+    def memory_bytes(self) -> int:
+        """
+        The size of the vectors that search scans from memory, for comparing precisions
+        """
+        if self.precision == "int8":
+            return self.compact.nbytes + self.scales.nbytes
+        if self.precision == "float16":
+            return self.compact.nbytes
+        return self.embeddings.nbytes
+
+    @classmethod
+    def kmeans(cls, vectors: np.ndarray, k: int) -> np.ndarray:
+        rng = np.random.default_rng(42)
+        sample = vectors[rng.choice(len(vectors), min(len(vectors), cls.TRAINING_SAMPLE), replace=False)]
+        centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+        for _ in range(cls.ITERATIONS):
+            assignments = cls.assign(sample, centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            counts = np.bincount(assignments, minlength=k)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+        return centroids
+
+    @classmethod
+    def assign(cls, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        assignments = np.empty(len(vectors), dtype=np.int64)
+        centroid_norms = (centroids ** 2).sum(axis=1)
+        for start in range(0, len(vectors), cls.BATCH):
+            batch = vectors[start:start + cls.BATCH]
+            assignments[start:start + cls.BATCH] = np.argmin(centroid_norms - 2 * batch @ centroids.T, axis=1)
+        return assignments
+
+    def record(self, row: int) -> Dict:
+        return json.loads(self.records[self.offsets[row]:self.offsets[row + 1]])
+
+    def candidates(self, vector: np.ndarray, k: int = 0) -> np.ndarray:
+        """
+        The rows in the nprobe clusters nearest to this vector, probing further clusters until there are at least k
+        """
+        order = np.argsort(((self.centroids - vector) ** 2).sum(axis=1))
+        sizes = np.cumsum(np.diff(self.list_offsets)[order])
+        probes = max(self.nprobe, int(np.searchsorted(sizes, min(k, self.count))) + 1)
+        nearest = order[:probes]
+        return np.concatenate([np.arange(self.list_offsets[c], self.list_offsets[c + 1]) for c in nearest])
+
+    def search(self, vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the rows and squared L2 distances of the k nearest products to each vector
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.method == "hnsw":
+            rows, distances = self.hnsw.knn_query(vectors, k=k)
+            return rows.astype(np.int64), distances
+        all_rows, all_distances = [], []
+        for vector in vectors:
+            rows = self.candidates(vector, k)
+            distances = ((self.vectors_for(rows) - vector) ** 2).sum(axis=1)
+            if self.rerank and self.precision != "float32":
+                rows = rows[np.argsort(distances)[:max(self.rerank, k)]]
+                distances = ((np.asarray(self.embeddings[rows]) - vector) ** 2).sum(axis=1)
+            best = np.argsort(distances)[:k]
+            all_rows.append(rows[best])
+            all_distances.append(distances[best])
+        return np.array(all_rows), np.array(all_distances)
+
+    def exact_search(self, vectors: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Brute force search over every row, as ground truth for measuring recall
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        distances = np.empty((len(vectors), self.count), dtype=np.float32)
+        vector_norms = (vectors ** 2).sum(axis=1)[:, None]
+        for start in range(0, self.count, self.BATCH):
+            block = np.asarray(self.embeddings[start:start + self.BATCH])
+            block_norms = (block ** 2).sum(axis=1)[None, :]
+            distances[:, start:start + len(block)] = vector_norms - 2 * vectors @ block.T + block_norms
+        rows = np.argsort(distances, axis=1)[:, :k]
+        return rows, np.take_along_axis(distances, rows, axis=1)
+
+
+class AnnRetriever:
+    """
+    Nearest neighbour lookups against an in-process ProductIndex, returning the same shape of results as Chroma
+    """
+
+    def __init__(self, index: ProductIndex):
+        self.index = index
+
+    def query(self, vectors: np.ndarray, n_results: int = 5) -> List[Neighbours]:
+        rows, distances = self.index.search(vectors, n_results)
+        results = []
+        for row_list, distance_list in zip(rows, distances):
+            records = [self.index.record(row) for row in row_list]
+            results.append(([r['document'] for r in records], [r['metadata'] for r in records],
+                            [float(d) for d in distance_list]))
+        return results
@@ -0,0 +1,213 @@
+import os
+import json
+import math
+import time
+import statistics
+from typing import Callable, Dict, List, Optional
+
+SCHEDULE_FILENAME = "run_schedule.json"
+BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60]
+
+
+def histogram(latencies: List[float]) -> Dict[str, int]:
+    """
+    Count latencies in seconds into fixed buckets, labelled by their upper bound
+    """
+    counts = {f"<{bound}s": 0 for bound in BUCKETS}
+    counts[f">={BUCKETS[-1]}s"] = 0
+    for latency in latencies:
+        bound = next((b for b in BUCKETS if latency < b), None)
+        counts[f"<{bound}s" if bound is not None else f">={BUCKETS[-1]}s"] += 1
+    return counts
+
+
+class RunSchedule:
+    """
+    The start times of recent runs, persisted so that a separate warm pool process can learn their cadence
+    The cadence is the median gap between runs, so a missed run or a manual one doesn't throw it off;
+    until there are enough runs we assume the UI's 300 second timer
+    """
+
+    HISTORY = 50
+    DEFAULT_INTERVAL = 300.0
+    MAX_MISSED = 3
+
+    def __init__(self, filename: str = SCHEDULE_FILENAME):
+        self.filename = filename
+        self.times: List[float] = []
+        self.load()
+
+    def load(self) -> None:
+        """
+        Read the run times, keeping those we already have if the file is missing, partly written or corrupt
+        """
+        try:
+            with open(self.filename, "r") as file:
+                times = json.load(file)
+        except (OSError, ValueError):
+            return
+        if isinstance(times, list) and all(isinstance(t, (int, float)) for t in times):
+            self.times = times[-self.HISTORY:]
+
+    def record(self, at: Optional[float] = None) -> None:
+        """
+        Record that a run started now, or at the given time
+        """
+        self.load()
+        self.times = (self.times + [at if at is not None else time.time()])[-self.HISTORY:]
+        temporary = self.filename + ".tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.times, file)
+        os.replace(temporary, self.filename)
+
+    def interval(self) -> float:
+        gaps = [later - earlier for earlier, later in zip(self.times, self.times[1:]) if later > earlier]
+        return statistics.median(gaps) if len(gaps) >= 2 else self.DEFAULT_INTERVAL
+
+    def next_run(self, after: float) -> Optional[float]:
+        """
+        The first expected run at or after this time, or None if there's no history,
+        or runs have stopped: MAX_MISSED expected runs have gone by without one
+        """
+        if not self.times:
+            return None
+        last, interval = self.times[-1], self.interval()
+        if after <= last:
+            return last + interval
+        expected = last + math.ceil((after - last) / interval) * interval
+        return expected if expected <= last + self.MAX_MISSED * interval else None
+
+
+class WarmPoolController:
+    """
+    Keeps the Pricer warm only around the times runs are expected, instead of pinging it around the clock
+    From LEAD seconds before each expected run until LINGER seconds after it, the Pricer is pinged every
+    PING_INTERVAL seconds; the rest of the time nothing is sent, and the container is left to scale down
+    A ping more than warm_ttl seconds after the last one is counted as a cold start, the others as warm,
+    so the two latency histograms show what pre-warming costs and saves
+    The lead grows to COLD_MARGIN times the p95 of the cold starts measured so far, so that a container
+    that's slower to start than the configured lead is still warm in time
+    A failed ping is logged and counted, and the controller carries on
+    The pricer can be any object with a wake_up method: a SpecialistAgent backend, or a SimulatedPricer
+    """
+
+    LEAD = 30.0
+    LINGER = 60.0
+    PING_INTERVAL = 30.0
+    WARM_TTL = 60.0    # Modal's default scaledown window, which the Pricer doesn't override
+    COLD_MARGIN = 1.5
+    TICK = 5.0
+
+    def __init__(self, pricer, schedule: Optional[RunSchedule] = None, clock: Callable[[], float] = time.time,
+                 sleep: Callable[[float], None] = time.sleep, log: Callable[[str], None] = print,
+                 lead: float = LEAD, linger: float = LINGER, ping_interval: float = PING_INTERVAL,
+                 warm_ttl: float = WARM_TTL):
+        """
+        :param lead: the least seconds before an expected run to start pinging
+        :param linger: seconds after an expected run to keep pinging
+        :param ping_interval: seconds between pings, which should be well under the container's scaledown window
+        :param warm_ttl: seconds a container stays up after a call, the backend's scaledown window
+        """
+        self.pricer = pricer
+        self.schedule = schedule or RunSchedule()
+        self.clock = clock
+        self.sleep = sleep
+        self.log = log
+        self.lead = lead
+        self.linger = linger
+        self.ping_interval = ping_interval
+        self.warm_ttl = warm_ttl
+        self.last_ping = None
+        self.retry_at = None
+        self.latencies = {"cold": [], "warm": []}
+        self.failures = 0
+
+    def effective_lead(self) -> float:
+        cold = self.latencies["cold"]
+        if not cold:
+            return self.lead
+        p95 = statistics.quantiles(cold, n=20)[-1] if len(cold) >= 2 else cold[0]
+        return max(self.lead, self.COLD_MARGIN * p95)
+
+    def in_warm_window(self, now: float) -> bool:
+        self.schedule.load()
+        expected = self.schedule.next_run(now - self.linger)
+        return expected is not None and expected - self.effective_lead() <= now <= expected + self.linger
+
+    def ping(self, now: float) -> Optional[float]:
+        """
+        Wake the pricer, returning the latency, or None if the ping failed
+        """
+        kind = "warm" if self.last_ping is not None and now - self.last_ping < self.warm_ttl else "cold"
+        try:
+            self.pricer.wake_up()
+        except Exception as e:
+            self.failures += 1
+            self.last_ping = None
+            self.retry_at = now + self.ping_interval
+            self.log(f"Warm pool ping failed ({self.failures} so far): {e}")
+            return None
+        self.last_ping = self.clock()
+        self.retry_at = None
+        latency = self.last_ping - now
+        self.latencies[kind].append(latency)
+        return latency
+
+    def step(self) -> str:
+        """
+        Decide what to do now: "idle" outside a warm window, "ping" if we pinged, "warm" if a recent ping suffices,
+        "failed" if the ping failed, or "backoff" while waiting ping_interval to retry a failed ping
+        """
+        now = self.clock()
+        if not self.in_warm_window(now):
+            return "idle"
+        if self.retry_at is not None and now < self.retry_at:
+            return "backoff"
+        if self.last_ping is not None and now - self.last_ping < self.ping_interval:
+            return "warm"
+        latency = self.ping(now)
+        if latency is None:
+            return "failed"
+        self.log(f"Warm pool pinged the Pricer in {latency:.2f}s; runs expected every {self.schedule.interval():.0f}s")
+        return "ping"
+
+    def run(self, until: Optional[float] = None) -> None:
+        """
+        Keep stepping, forever or until the clock reaches until; no error in a step stops the loop
+        """
+        while until is None or self.clock() < until:
+            try:
+                self.step()
+            except Exception as e:
+                self.log(f"Warm pool step failed: {e}")
+            self.sleep(self.TICK)
+
+    def report(self) -> Dict[str, Dict]:
+        report = {kind: {"count": len(values), "histogram": histogram(values)} for kind, values in self.latencies.items()}
+        return {**report, "failed": self.failures, "lead": round(self.effective_lead(), 1)}
+
+
+class SimulatedPricer:
+    """
+    A local stand-in for the Pricer that behaves like a scale-to-zero container:
+    a call more than idle_timeout seconds after the previous one pays cold_start seconds, others pay warm seconds
+    """
+
+    def __init__(self, cold_start: float = 8.0, warm: float = 0.05, idle_timeout: float = 120.0,
+                 clock: Callable[[], float] = time.time, sleep: Callable[[float], None] = time.sleep):
+        self.cold_start = cold_start
+        self.warm = warm
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.sleep = sleep
+        self.last_call = None
+        self.cold_starts = 0
+        self.calls = 0
+
+    def wake_up(self) -> str:
+        cold = self.last_call is None or self.clock() - self.last_call > self.idle_timeout
+        self.sleep(self.cold_start if cold else self.warm)
+        self.last_call = self.clock()
+        self.cold_starts += cold
+        self.calls += 1
+        return "ok"
@@ -0,0 +1,312 @@
+"""
+The Specialist Agent's pricing model, kept free of Modal so that it can also be run and benchmarked locally
+
+    core = PricerCore.load(bake_weights("weights"), variant="bf16", local_files_only=True)
+    core.price("Samsung 55 inch 4K smart TV")
+"""
+
+import os
+import re
+import copy
+from typing import List, Optional, Tuple
+import torch
+from huggingface_hub import snapshot_download
+from transformers import (AutoTokenizer, AutoModelForCausalLM, DynamicCache, LogitsProcessor, LogitsProcessorList,
+                          StoppingCriteria, StoppingCriteriaList, set_seed)
+
+BASE_MODEL = "TinyLlama/TinyLlama-1.1B-Chat-v1.0"
+# A commit of the model repo, never a branch, so that the baked weights and the image layer holding them
+# change exactly when this does; the weights are stored, and rebuilt, per revision
+MODEL_REVISION = "fe8a4ea1ffedaf415f4da2f062534de366a451e6"
+COMMIT_SHA = re.compile(r"[0-9a-f]{40}")
+VARIANTS   = ("fp32", "bf16", "int8")
+WEIGHT_FILES = ["*.json", "*.safetensors", "tokenizer.model"]
+QUESTION   = "Please reply with only the numeric price in USD, no extra text."
+PREFIX     = f"{QUESTION}\n\n"
+NUMBER     = re.compile(r"[-+]?\d*\.\d+|\d+")
+
+
+def parse_price(text: str) -> float:
+    match = NUMBER.search(text.replace(",", ""))
+    return float(match.group()) if match else 0.0
+
+
+def weights_path(root: str, model_name: str = BASE_MODEL, revision: str = MODEL_REVISION) -> str:
+    return os.path.join(root, model_name.replace("/", "__"), revision)
+
+
+def bake_weights(root: str, model_name: str = BASE_MODEL, revision: str = MODEL_REVISION,
+                 token: Optional[str] = None) -> str:
+    """
+    Download the tokenizer and safetensors weights for this revision into a folder of their own under root,
+    once, so that loading them later needs no network, and save the tokenizer's NumericTokens masks alongside
+    :param revision: a full commit SHA of the model repo; branch and tag names are refused, as they can move
+    :return: the folder, to pass to PricerCore.load with local_files_only=True
+    """
+    if not COMMIT_SHA.fullmatch(revision):
+        raise ValueError(f"Model revision {revision} must be a full commit SHA, not a branch or tag")
+    path = weights_path(root, model_name, revision)
+    if not os.path.exists(os.path.join(path, "config.json")):
+        snapshot_download(model_name, revision=revision, local_dir=path, token=token, allow_patterns=WEIGHT_FILES)
+    if not os.path.exists(os.path.join(path, NumericTokens.FILENAME)):
+        NumericTokens(AutoTokenizer.from_pretrained(path, local_files_only=True)).save(path)
+    return path
+
+
+class NumericTokens:
+    """
+    Classifies the tokenizer's vocabulary: tokens made only of digits, and the tokens that continue a number
+    bake_weights saves the masks next to the weights, so that a cold start loads them instead of decoding the vocab
+    """
+
+    FILENAME = "numeric_tokens.pt"
+
+    def __init__(self, tokenizer, masks: Optional[Tuple[torch.Tensor, torch.Tensor]] = None):
+        self.tokenizer = tokenizer
+        self.digits, self.separators = masks or self.classify(tokenizer)
+
+    @staticmethod
+    def classify(tokenizer) -> Tuple[torch.Tensor, torch.Tensor]:
+        size = len(tokenizer)
+        digits = torch.zeros(size, dtype=torch.bool)
+        separators = torch.zeros(size, dtype=torch.bool)
+        for token_id in range(size):
+            text = tokenizer.convert_tokens_to_string([tokenizer.convert_ids_to_tokens(token_id)]).strip()
+            if text.isdigit():
+                digits[token_id] = True
+            elif text in (".", ","):
+                separators[token_id] = True
+        return digits, separators
+
+    def save(self, folder: str) -> None:
+        torch.save({"digits": self.digits, "separators": self.separators}, os.path.join(folder, self.FILENAME))
+
+    @classmethod
+    def load(cls, tokenizer, folder: str) -> "NumericTokens":
+        """
+        Use the masks saved in this folder if there are any for a vocabulary of this size, else classify it now
+        """
+        path = os.path.join(folder, cls.FILENAME)
+        if os.path.exists(path):
+            masks = torch.load(path)
+            if len(masks["digits"]) == len(tokenizer):
+                return cls(tokenizer, (masks["digits"], masks["separators"]))
+        return cls(tokenizer)
+
+    def generated(self, row: torch.Tensor) -> str:
+        return self.tokenizer.decode(row, skip_special_tokens=True)
+
+
+class DigitsOnly(LogitsProcessor):
+    """
+    Makes the first generated token a digit, and the token after a decimal point or comma a digit too
+    Once a number has started, any token is allowed, and NumberComplete stops at the first that isn't part of it
+    """
+
+    def __init__(self, numeric: NumericTokens, prompt_length: int):
+        self.numeric = numeric
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        for row in range(input_ids.shape[0]):
+            text = self.numeric.generated(input_ids[row, self.prompt_length:])
+            if not any(char.isdigit() for char in text):
+                allowed = self.numeric.digits
+            elif text.endswith((".", ",")):
+                allowed = self.numeric.digits
+            else:
+                continue
+            scores[row, ~allowed[:scores.shape[1]]] = -float("inf")
+        return scores
+
+
+class NumberComplete(StoppingCriteria):
+    """
+    Stops each sequence once its number is complete: a token that can't continue it has been generated,
+    or it has two decimal places
+    """
+
+    def __init__(self, numeric: NumericTokens, prompt_length: int):
+        self.numeric = numeric
+        self.prompt_length = prompt_length
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        if input_ids.shape[1] <= self.prompt_length:
+            return done
+        for row in range(input_ids.shape[0]):
+            last = input_ids[row, -1].item()
+            ended = last < len(self.numeric.digits) and not (self.numeric.digits[last] or self.numeric.separators[last])
+            cents = re.search(r"\.\d\d$", self.numeric.generated(input_ids[row, self.prompt_length:]))
+            done[row] = ended or cents is not None
+        return done
+
+
+class PricerCore:
+    """
+    Prices product descriptions with the model
+    price() and price_batch() reuse a KV cache of the constant QUESTION prefix, so only the descriptions run through
+    the model per call, and constrain decoding so that the reply is always a number, stopping as soon as it's complete
+    price_baseline() and price_batch_baseline() are the original paths, for comparison: encode everything,
+    generate 8 tokens, then regex
+    """
+
+    MAX_NEW_TOKENS = 8
+
+    def __init__(self, model, tokenizer, numeric: Optional[NumericTokens] = None):
+        self.model = model
+        self.tokenizer = tokenizer
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        # Pad on the left so that every prompt in a batch ends where generation begins
+        self.tokenizer.padding_side = "left"
+        self.numeric = numeric or NumericTokens(tokenizer)
+        self.prefix_ids = tokenizer(PREFIX, return_tensors="pt")["input_ids"]
+        with torch.no_grad():
+            self.prefix_cache = model(self.prefix_ids, past_key_values=DynamicCache(), use_cache=True).past_key_values
+
+    @classmethod
+    def load(cls, source: str = BASE_MODEL, token: Optional[str] = None, variant: str = "fp32",
+             local_files_only: bool = False) -> "PricerCore":
+        """
+        Load the tokenizer and model
+        :param source: a model name on the hub, or a folder from bake_weights
+        :param variant: "fp32"; "bf16" for half the memory; or "int8" for dynamic quantization of the linear layers
+        :param local_files_only: True to load straight from source without checking the hub for updates
+        """
+        if variant not in VARIANTS:
+            raise ValueError(f"Unknown variant {variant}; expected one of {VARIANTS}")
+        tokenizer = AutoTokenizer.from_pretrained(source, token=token, local_files_only=local_files_only)
+        # safetensors are memory-mapped, and low_cpu_mem_usage skips the random init of weights we'd overwrite
+        model = AutoModelForCausalLM.from_pretrained(
+            source,
+            torch_dtype=torch.bfloat16 if variant == "bf16" else torch.float32,
+            token=token,
+            local_files_only=local_files_only,
+            use_safetensors=True,
+            low_cpu_mem_usage=True
+        )
+        if variant == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        model.eval()
+        numeric = NumericTokens.load(tokenizer, source) if os.path.isdir(source) else None
+        return cls(model, tokenizer, numeric)
+
+    @classmethod
+    def from_baked(cls, root: str = "weights", variant: Optional[str] = None) -> "PricerCore":
+        """
+        Bake the weights under root if they aren't there yet, then load them locally
+        :param variant: by default from PRICER_VARIANT, or fp32
+        """
+        path = bake_weights(root, token=os.getenv("HF_TOKEN"))
+        return cls.load(path, variant=variant or os.getenv("PRICER_VARIANT", "fp32"), local_files_only=True)
+
+    def constraints(self, prompt_length: int) -> dict:
+        return {
+            "logits_processor": LogitsProcessorList([DigitsOnly(self.numeric, prompt_length)]),
+            "stopping_criteria": StoppingCriteriaList([NumberComplete(self.numeric, prompt_length)]),
+        }
+
+    def encode(self, description: str) -> Tuple[torch.Tensor, int]:
+        """
+        Tokenize the whole prompt in one go, as the baseline does, so that the tokens where the prefix meets the
+        description are the same as the baseline's
+        :return: the prompt's tokens, and how many of its leading tokens are the cached prefix's; that's the whole
+        prefix unless a token spans the boundary, and never the whole prompt, as generate needs a token to encode
+        """
+        input_ids = self.tokenizer(f"{PREFIX}{description}", return_tensors="pt")["input_ids"]
+        length = min(input_ids.shape[1] - 1, self.prefix_ids.shape[1])
+        differs = (input_ids[0, :length] != self.prefix_ids[0, :length]).nonzero()
+        return input_ids, int(differs[0]) if len(differs) else length
+
+    def cache_for(self, shared: int, rows: int = 1) -> DynamicCache:
+        """
+        A copy of the prefix cache cut to its first shared tokens, for each of this many rows
+        """
+        cache = copy.deepcopy(self.prefix_cache)
+        if shared < self.prefix_ids.shape[1]:
+            cache.crop(shared - self.prefix_ids.shape[1])
+        if rows > 1:
+            cache.batch_repeat_interleave(rows)
+        return cache
+
+    def price(self, description: str) -> float:
+        """
+        Price one description, continuing from a copy of the cached prefix
+        """
+        set_seed(42)
+        input_ids, shared = self.encode(description)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids,
+                attention_mask=torch.ones_like(input_ids),
+                past_key_values=self.cache_for(shared),
+                max_new_tokens=self.MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.constraints(input_ids.shape[1])
+            )
+        return parse_price(self.tokenizer.decode(outputs[0, input_ids.shape[1]:], skip_special_tokens=True))
+
+    def price_batch(self, descriptions: List[str]) -> List[float]:
+        """
+        Price several descriptions with one generate, continuing every row from the cached prefix
+        Each prompt is tokenized whole and split after the prefix tokens that every row shares; the rest are
+        left-padded after the shared prefix and the padding is masked out, so each row sees exactly the baseline's
+        tokens, at the same positions as in price()
+        """
+        set_seed(42)
+        encoded = [self.encode(description) for description in descriptions]
+        shared = min(length for _, length in encoded)
+        suffixes = self.tokenizer.pad({"input_ids": [ids[0, shared:].tolist() for ids, _ in encoded]},
+                                      padding=True, return_tensors="pt")
+        rows = len(descriptions)
+        prefix_ids = self.prefix_ids[:, :shared].expand(rows, -1)
+        input_ids = torch.cat([prefix_ids, suffixes["input_ids"]], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids), suffixes["attention_mask"]], dim=1)
+        with torch.no_grad():
+            outputs = self.model.generate(
+                input_ids,
+                attention_mask=attention_mask,
+                past_key_values=self.cache_for(shared, rows),
+                max_new_tokens=self.MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.constraints(input_ids.shape[1])
+            )
+        texts = self.tokenizer.batch_decode(outputs[:, input_ids.shape[1]:], skip_special_tokens=True)
+        return [parse_price(text) for text in texts]
+
+    def price_batch_baseline(self, descriptions: List[str]) -> List[float]:
+        """
+        The batched path without the prefix cache: the whole prompt of every row is encoded in one left-padded generate
+        """
+        set_seed(42)
+        prompts = [f"{PREFIX}{description}" for description in descriptions]
+        inputs = self.tokenizer(prompts, return_tensors="pt", padding=True)
+        prompt_length = inputs["input_ids"].shape[1]
+        with torch.no_grad():
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=inputs["attention_mask"],
+                max_new_tokens=self.MAX_NEW_TOKENS,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **self.constraints(prompt_length)
+            )
+        texts = self.tokenizer.batch_decode(outputs[:, prompt_length:], skip_special_tokens=True)
+        return [parse_price(text) for text in texts]
+
+    def price_baseline(self, description: str) -> float:
+        set_seed(42)
+        inputs = self.tokenizer(f"{PREFIX}{description}", return_tensors="pt")
+        with torch.no_grad():
+            outputs = self.model.generate(
+                inputs["input_ids"],
+                attention_mask=torch.ones_like(inputs["input_ids"]),
+                max_new_tokens=self.MAX_NEW_TOKENS,
+                num_return_sequences=1,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id
+            )
+        return parse_price(self.tokenizer.decode(outputs[0], skip_special_tokens=True))
@@ -0,0 +1,77 @@
+"""
+A lightweight local HTTP stand-in for the Modal Pricer, for co-located deployments and offline load tests
+
+    python pricer_server.py --port 8765
+    SPECIALIST_BACKEND=http SPECIALIST_URL=http://127.0.0.1:8765 python price_is_right.py
+
+Descriptions from concurrent requests are micro-batched into single batched generates
+    POST /price        {"description": "..."}       -> {"price": 99.0}
+    POST /price_batch  {"descriptions": ["...", ...]} -> {"prices": [99.0, ...]}
+    GET  /health                                      -> {"status": "ok", ...}
+"""
+
+import json
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from price_agents.batching import MicroBatcher
+from pricer_model import PricerCore
+
+
+def make_handler(batcher: MicroBatcher):
+
+    class PricerHandler(BaseHTTPRequestHandler):
+
+        protocol_version = "HTTP/1.1"
+
+        def reply(self, status: int, body: dict) -> None:
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self.reply(200, {"status": "ok", "batches": batcher.batches, "mean_batch": batcher.mean_batch_size()})
+            else:
+                self.reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                if self.path == "/price":
+                    self.reply(200, {"price": batcher.submit(request["description"])})
+                elif self.path == "/price_batch":
+                    self.reply(200, {"prices": batcher.submit_many(request["descriptions"])})
+                else:
+                    self.reply(404, {"error": "not found"})
+            except (ValueError, KeyError) as e:
+                self.reply(400, {"error": str(e)})
+            except Exception as e:
+                self.reply(500, {"error": str(e)})
+
+        def log_message(self, format, *args):
+            pass
+
+    return PricerHandler
+
+
+def serve(core: PricerCore, host: str, port: int, window: float, max_batch: int) -> ThreadingHTTPServer:
+    batcher = MicroBatcher(core.price_batch, window=window, max_batch=max_batch)
+    return ThreadingHTTPServer((host, port), make_handler(batcher))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the pricing model over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--weights", default="weights")
+    parser.add_argument("--variant", default=None)
+    parser.add_argument("--window", type=float, default=MicroBatcher.WINDOW)
+    parser.add_argument("--max-batch", type=int, default=MicroBatcher.MAX_BATCH)
+    args = parser.parse_args()
+
+    server = serve(PricerCore.from_baked(args.weights, args.variant), args.host, args.port, args.window, args.max_batch)
+    print(f"Pricer serving on http://{args.host}:{args.port}")
+    server.serve_forever()
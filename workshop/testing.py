@@ -32,6 +32,9 @@ class Tester:
     def run_datapoint(self, i):
         datapoint = self.data[i]
         guess = self.predictor(datapoint)
+        self.record(i, datapoint, guess)
+
+    def record(self, i, datapoint, guess):
         truth = datapoint.price
         error = abs(guess - truth)
         color = self.color_for(error, truth)
@@ -71,4 +74,62 @@ class Tester:
 
     @classmethod
     def test(cls, function, data):
-        cls(function, data).run()
\ No newline at end of file
+        cls(function, data).run()
+
+
+class GatedTester(Tester):
+    """
+    Tests a confidence-gated predictor, such as the Frontier Agent's kNN fast path
+    The predictor returns a dict with a "knn" estimate, its "confidence", and the "llm" estimate
+    The gated guess is the kNN estimate when confidence reaches the threshold, otherwise the LLM estimate
+    The report adds the skip rate and how the errors compare with always calling the LLM
+    """
+
+    def __init__(self, predictor, data, threshold, title=None, size=250):
+        super().__init__(predictor, data, title, size)
+        self.threshold = threshold
+        self.diagnoses = []
+
+    def run_datapoint(self, i):
+        datapoint = self.data[i]
+        diagnosis = self.predictor(datapoint)
+        self.diagnoses.append((diagnosis, datapoint.price))
+        guess = diagnosis["knn"] if diagnosis["confidence"] >= self.threshold else diagnosis["llm"]
+        self.record(i, datapoint, guess)
+
+    def gate_stats(self, threshold):
+        """
+        Skip rate and average errors if the gate were set at this threshold
+        """
+        skipped = [(d, truth) for d, truth in self.diagnoses if d["confidence"] >= threshold]
+        gated = [abs((d["knn"] if d["confidence"] >= threshold else d["llm"]) - truth) for d, truth in self.diagnoses]
+        llm = [abs(d["llm"] - truth) for d, truth in self.diagnoses]
+        n = len(self.diagnoses)
+        return {
+            "threshold": threshold,
+            "skip_rate": len(skipped) / n,
+            "gated_error": sum(gated) / n,
+            "llm_error": sum(llm) / n,
+            "delta": (sum(gated) - sum(llm)) / n,
+            "skipped_knn_error": sum(abs(d["knn"] - t) for d, t in skipped) / len(skipped) if skipped else 0.0,
+            "skipped_llm_error": sum(abs(d["llm"] - t) for d, t in skipped) / len(skipped) if skipped else 0.0,
+        }
+
+    def sweep(self, thresholds):
+        """
+        Print the skip rate and accuracy delta for each threshold, using the results already gathered
+        """
+        for threshold in thresholds:
+            stats = self.gate_stats(threshold)
+            print(f"Threshold {threshold:.2f}: skip rate {stats['skip_rate']*100:.1f}% "
+                  f"gated error ${stats['gated_error']:,.2f} vs LLM-only ${stats['llm_error']:,.2f} "
+                  f"(delta ${stats['delta']:+,.2f}); on skipped items kNN ${stats['skipped_knn_error']:,.2f} "
+                  f"vs LLM ${stats['skipped_llm_error']:,.2f}")
+
+    def report(self):
+        self.sweep([self.threshold])
+        super().report()
+
+    @classmethod
+    def test(cls, function, data, threshold=0.8):
+        cls(function, data, threshold).run()